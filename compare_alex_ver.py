@@ -1,15 +1,35 @@
 """diff script"""
 
 import configparser
+import json
 import time
 from datetime import datetime
-from re import split as re_split, findall as re_findall, fullmatch as re_fullmatch
-from os import name as os_name, path as os_path, makedirs as os_makedirs
-from sys import exit as sys_exit
+from re import split as re_split, findall as re_findall
+from os import (name as os_name, path as os_path, makedirs as os_makedirs,
+                listdir as os_listdir, remove as os_remove, rmdir as os_rmdir)
+from sys import exit as sys_exit, stdout as sys_stdout
 from glob import glob
-from threading import active_count as threading_active_count, Thread
-from shutil import move
+from collections import deque, Counter
+from contextlib import contextmanager
+from io import StringIO
+from random import Random
+from operator import itemgetter
+from threading import Thread
+from multiprocessing import Pool, Value, Queue as mp_Queue
+from signal import signal, SIGINT, SIG_IGN
+from shutil import move, copyfileobj, rmtree
+from tempfile import mkdtemp
+try:
+    from os import sysconf as os_sysconf
+except ImportError:
+    os_sysconf = None # not available on Windows, memory_budget has to be set
+import compare_db as cdb
 import compare_functions as cf
+import compare_logger as clog
+import compare_reader as cread
+import compare_reports as crep
+import compare_store as cstore
+import compare_vector as cvec
 
 
 start_time = time.time()
@@ -22,7 +42,8 @@ else:
     SCRIPT_PATH = re_split(r'(.+/).+$', __file__)[1] # for linux
 
 LOGFILE_NAME = f"{SCRIPT_PATH}diff_{diff_tag_prefix}.log"
-logfile = open(LOGFILE_NAME, 'a+', encoding='utf-8')
+# LogWriter of the main process, see init_log, pool workers get QueueLogWriter
+logfile = None
 config = configparser.ConfigParser()
 config_keys = configparser.ConfigParser()
 
@@ -35,6 +56,8 @@ fields_error_dict = {} # for output errors to livestat
 # 17 broken records
 stats_list = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, '', 0, '', 0, 0] # for total stats info
 stats_list_curr_file = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, '', 0, '', 0, 0]
+# stats_list counters, collected by pool workers and merged into total stats
+MERGED_STATS_INDEXES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 14, 17)
 REPORT_HEADER = (f"{'File name':26}\t{'OldSys records':20}\t{'NewSys records':20}\t"
                  f"{'Matched records':20}\t{'Lost records':20}\t{'Extra records':20}\t"
                  f"{'OldSys repeats':20}\t{'NewSys repeats':20}\t{'Broken records':20}\t"
@@ -42,10 +65,66 @@ REPORT_HEADER = (f"{'File name':26}\t{'OldSys records':20}\t{'NewSys records':20
 legacy_total_lines = 0
 newsys_total_lines = 0
 raw_lines_count_by_file = {} # keep number of lines for each file
-errored_fields_set = set() # for proper closing err report files
+LINES_COUNT_SAMPLE_SIZE = 1024 * 1024 # bytes sampled for lines count estimation
+KEYS_FILE_NAME = f"{SCRIPT_PATH}auto_generated_keys.ini"
+KEYS_SAMPLE_SEED = 1 # fixed seed, same files give same sample and sample fingerprint
+# settings auto found diff keys depend on
+KEYS_SCHEMA_SETTINGS = ('number_of_fields', 'delimiter_type', 'delimiter',
+                        'header_records_number', 'record_field_sizes',
+                        'record_field_sizes_tail', 'excluded_diff_keys')
+# settings pair reports depend on, pair cache is not used if any of them is changed
+PAIR_CACHE_SETTINGS = ('encode_etl', 'encode_src', 'diff_keys', 'legacy_system_name',
+                       'new_system_name', 'number_of_fields', 'excluded_fields',
+                       'delimiter_type', 'delimiter', 'header_records_number',
+                       'trailer_records_number', 'record_field_names', 'record_field_sizes',
+                       'record_field_sizes_tail', 'diff_mode', 'broken_records_output',
+                       'result_db', 'cross_file_match', 'field_comparators')
+PAIR_CACHE_DIR_NAME = '.pair_cache' # pair results cache dir in diff_out_dir
+pair_cache_ids = {} # cache dir, new sys file and files identity of each pair to diff
+prefetch_readers = {} # background readers of files to be read next
+METRICS_FILE_NAME = 'diff_metrics.json' # run metrics in result dir
+BROKEN_RECORDS_FILE_NAME = 'broken_records.jsonl' # compact broken records report
+RESULT_DB_FILE_NAME = 'diff_results.db' # sqlite results database in result dir
+RESULT_DB_BUFFER_ROWS = 10000 # rows inserted in one transaction
+result_store = None # sqlite results writer, if result_db is on
+result_pair_id = 0 # results database id of current pair
+PHASES = ('listing', 'lines_count', 'keys_discovery', 'reading', 'parsing', 'key_composition',
+          'set_operations', 'compare', 'pattern_diff', 'report_writing')
+phase_times = dict.fromkeys(PHASES, 0.0) # current pair phases time, seconds
+total_phase_times = dict.fromkeys(PHASES, 0.0) # all pairs and script phases time, seconds
+pairs_metrics = [] # metrics of each diffed pair
 thread_break_flag = False
+stat_screen_flag = False # console is redrawn by stat_out, messages go to log only
 interrupt_flag = False
+error_flag = False
 diff_pattern_dict = {} # for top error patterns report
+report_dir = '' # dir for pair reports, pool workers use own parts dir
+report_writer = None # buffered report files writer
+pool_deep_diff_cache_stats = [0, 0, 0] # diff patterns cache counters of pool workers
+fixed_field_slices = [] # precompiled field slices for delimiter_type = fixed
+fixed_record_length = 0
+compare_plan = () # (field number, comparator) of compared fields, None - exact comparator
+compare_fields_count = 0 # number_of_fields of compared records
+bytes_delimiter = b'' # encoded delimiter for read_mode = bytes
+# encodings which keep ascii delimiter and line end as single bytes, never a part of other chars
+BYTES_MODE_ENCODINGS = ('utf-8', 'cp1251')
+STAT_REFRESH_DELAY = 3 # seconds between stat updates
+defective_log_count = 0 # defective records of current pair, messages are logged up to limit
+defective_lines_log_count = 0 # defective lines read from current pair files
+oldsys_defective_lines = 0 # old sys lines of current pair with wrong number of fields
+SPILL_RECORD_OVERHEAD = 150 # approx bytes of records store index for one record
+SPILL_COMPRESSION_RATIO = 5 # approx uncompressed to compressed pair file size ratio
+SPILL_MAX_BUCKETS = 256 # bucket files of one pair file are opened at once
+SPILL_BUFFER_SIZE = 16 * 1024 * 1024 # chars or bytes of spilled lines buffered in memory
+UNMATCHED_FILE_NAME = 'unmatched_records.jsonl' # pairs losts and extras for cross file match
+KEY_INDEX_FILE_NAME = '.key_index.db' # temporary key index of unmatched records
+is_pool_worker = False
+COMPARE_BATCH_SIZE = 10000 # matched records compared at once by numpy engine
+CHECKPOINT_FILE_NAME = 'diff_checkpoint.jsonl' # completed pairs manifest in result dir
+
+
+class UnsortedRecordsError(Exception):
+    """raised by merge diff mode if file records are not sorted by diff keys"""
 
 
 settings_dict = {
@@ -77,7 +156,29 @@ settings_dict = {
     'trailer_records_number': 0,
     'record_field_names': '',
     'record_field_sizes': '',
-    'record_field_sizes_tail': False
+    'record_field_sizes_tail': False,
+    'workers_count': 1,
+    'diff_mode': 'dict',
+    'report_buffer_size': 16,
+    'lines_count_mode': 'estimate',
+    'diff_pattern_cache_size': 100000,
+    'diff_keys_scan_lines': 100000,
+    'compare_engine': 'python',
+    'resume': False,
+    'pair_cache': False,
+    'read_buffer_size': 16,
+    'broken_records_output': 'fields',
+    'result_db': False,
+    'read_mode': 'text',
+    'progress_mode': 'auto',
+    'progress_log_interval': 60,
+    'defective_log_limit': 100,
+    'file_reader': 'stream',
+    'memory_budget': 0,
+    'spill_dir': '',
+    'cross_file_match': False,
+    'field_comparators': '',
+    'merge_key_order': 'text'
 }
 
 sections_dict = {
@@ -109,7 +210,29 @@ sections_dict = {
     'trailer_records_number': 'cdr_options',
     'record_field_names': 'cdr_options',
     'record_field_sizes': 'cdr_options',
-    'record_field_sizes_tail': 'cdr_options'
+    'record_field_sizes_tail': 'cdr_options',
+    'workers_count': 'general',
+    'diff_mode': 'general',
+    'report_buffer_size': 'storage_options',
+    'lines_count_mode': 'general',
+    'diff_pattern_cache_size': 'general',
+    'diff_keys_scan_lines': 'general',
+    'compare_engine': 'general',
+    'resume': 'general',
+    'pair_cache': 'general',
+    'read_buffer_size': 'storage_options',
+    'broken_records_output': 'storage_options',
+    'result_db': 'storage_options',
+    'read_mode': 'general',
+    'progress_mode': 'general',
+    'progress_log_interval': 'general',
+    'defective_log_limit': 'general',
+    'file_reader': 'storage_options',
+    'memory_budget': 'general',
+    'spill_dir': 'storage_options',
+    'cross_file_match': 'general',
+    'field_comparators': 'cdr_options',
+    'merge_key_order': 'general'
 }
 
 expected_dict = {
@@ -119,10 +242,33 @@ expected_dict = {
     'diff_keys_type': ['auto', 'manual'],
     'auto_keys_search_each_run': ['True', 'False'], 
     'delimiter_type': ['char', 'fixed'],
-    'record_field_sizes_tail': ['True', 'False']
+    'record_field_sizes_tail': ['True', 'False'],
+    'diff_mode': ['dict', 'merge', 'spill'],
+    'lines_count_mode': ['exact', 'estimate'],
+    'compare_engine': ['python', 'numpy'],
+    'resume': ['True', 'False'],
+    'pair_cache': ['True', 'False'],
+    'broken_records_output': ['fields', 'jsonl', 'both'],
+    'result_db': ['True', 'False'],
+    'read_mode': ['text', 'bytes'],
+    'progress_mode': ['auto', 'console', 'log'],
+    'file_reader': ['stream', 'mmap'],
+    'cross_file_match': ['True', 'False'],
+    'merge_key_order': ['text', 'numeric']
 }
 
 
+def init_log() -> None:
+    """open log file of the main process, it is not opened on import, so spawned pool
+       workers, which re-import the script, do not create own log files
+    Args:
+        None
+    Returns:
+        None: performs logfile init, lines are written by background thread"""
+    global logfile
+    logfile = clog.LogWriter(LOGFILE_NAME)
+
+
 def timestamp_output(msg: str) -> None:
     """console output with timestamp
     Args: 
@@ -130,12 +276,35 @@ def timestamp_output(msg: str) -> None:
     Returns: 
         None: performs console print of message with current timestamp"""
     ts = datetime.now()
-    if threading_active_count() <= 2:
+    if not stat_screen_flag and not is_pool_worker:
         print(ts, msg)
     # cf.write_to_file(LOGFILE_NAME, f"{ts} {msg}\n")
     logfile.write(f"{ts} {msg}\n")
 
 
+def defective_output(msgs: list, is_record: bool = True) -> None:
+    """log messages of defective record, messages of records over defective_log_limit
+       of pair are counted only, so malformed file does not flood the log
+    Args:
+        msgs (list): a list of messages of one defective record
+        is_record (bool):
+            True - means messages of compared record, both its lines are counted once
+            False - means messages of line read from pair file, such lines are counted
+                    separately, so a record is not counted again when it is compared
+    Returns:
+        None: performs timestamp_output of messages"""
+    global defective_log_count, defective_lines_log_count
+    if is_record:
+        defective_log_count += 1
+        count = defective_log_count
+    else:
+        defective_lines_log_count += 1
+        count = defective_lines_log_count
+    if not settings_dict['defective_log_limit'] or count <= settings_dict['defective_log_limit']:
+        for i in msgs:
+            timestamp_output(i)
+
+
 def print_except_msg(key: str) -> None:
     """prints detailed exception message
     Args:
@@ -172,8 +341,8 @@ def init_settings() -> None:
         None
     Returns:
         None: performs settings init process"""
-    try:
-        for k, v in settings_dict.items():
+    for k, v in settings_dict.items():
+        try:
             val = config.get(sections_dict[k], k).strip()
             if val != '':
                 if k in expected_dict:
@@ -194,8 +363,9 @@ def init_settings() -> None:
                     value = v
                 timestamp_output(f"(DEFAULTS) no value provided for {sections_dict[k]}/{k}, "
                                     f"used default setting: {value}")
-    except:
-        print_except_msg(k)
+        except (configparser.Error, ValueError):
+            # keep reading other settings, missing one gets default value
+            print_except_msg(k)
 
     # for proper tabulation symbol passthrough
     if settings_dict['delimiter'] == ('\\t'):
@@ -235,6 +405,9 @@ def init_settings() -> None:
                   'has empty keys or key numbers has duplicates')
             sys_exit()
 
+    # compile compared fields and field comparators
+    init_compare_plan()
+
     # check if record_field_sizes is provided in case of delimiter_type = fixed
     if settings_dict['delimiter_type'] == 'fixed' and settings_dict['record_field_sizes'] == '':
         timestamp_output('Error: record_field_sizes must be provided if delimiter_type = fixed')
@@ -252,6 +425,90 @@ def init_settings() -> None:
                     timestamp_output('(ERROR) some of record_field_sizes are empty')
                     sys_exit()
 
+    # checking number of diff pool workers
+    if settings_dict['workers_count'] < 1:
+        timestamp_output('(ERROR) workers_count must be >= 1')
+        sys_exit()
+
+    # checking report files memory buffer size, MB
+    if settings_dict['report_buffer_size'] < 1:
+        timestamp_output('(ERROR) report_buffer_size must be >= 1')
+        sys_exit()
+
+    # checking log rotation limits, log file size limit is in MB, 0 - no rotation
+    if settings_dict['log_file_size_limit'] < 0 or settings_dict['old_log_files_count'] < 0:
+        timestamp_output('(ERROR) log_file_size_limit and old_log_files_count must be >= 0')
+        sys_exit()
+    logfile.set_rotation(settings_dict['log_file_size_limit'] * 1024 * 1024,
+                         settings_dict['old_log_files_count'])
+
+    # checking defective records messages limit for each pair, 0 - no limit
+    if settings_dict['defective_log_limit'] < 0:
+        timestamp_output('(ERROR) defective_log_limit must be >= 0')
+        sys_exit()
+
+    # checking memory budget of one pair for diff_mode = dict, MB, 0 - auto
+    if settings_dict['memory_budget'] < 0:
+        timestamp_output('(ERROR) memory_budget must be >= 0')
+        sys_exit()
+    if settings_dict['memory_budget'] == 0:
+        settings_dict['memory_budget'] = get_auto_memory_budget()
+
+    # checking headless progress log interval, seconds
+    if settings_dict['progress_log_interval'] < 1:
+        timestamp_output('(ERROR) progress_log_interval must be >= 1')
+        sys_exit()
+
+    # auto progress mode draws console stats in terminal only, e.g. not under cron
+    if settings_dict['progress_mode'] == 'auto':
+        settings_dict['progress_mode'] = 'console' if sys_stdout.isatty() else 'log'
+
+    # checking read ahead buffer size, MB, 0 - files are read without read ahead
+    if settings_dict['read_buffer_size'] < 0:
+        timestamp_output('(ERROR) read_buffer_size must be >= 0')
+        sys_exit()
+
+    # bytes read mode splits raw lines, values are decoded for reports only
+    if settings_dict['read_mode'] == 'bytes':
+        reason = ''
+        if settings_dict['encode_etl'] != settings_dict['encode_src']:
+            reason = 'encode_etl and encode_src are different'
+        elif settings_dict['encode_etl'] not in BYTES_MODE_ENCODINGS:
+            reason = f"{settings_dict['encode_etl']} encoding is not supported"
+        elif settings_dict['delimiter_type'] == 'fixed' and \
+                settings_dict['encode_etl'] != 'cp1251':
+            # field sizes are in chars, multibyte chars change field offsets
+            reason = 'fixed field sizes need single byte encoding'
+        elif settings_dict['diff_mode'] == 'merge' and settings_dict['encode_etl'] != 'utf-8':
+            # sorted files order is kept for utf-8 bytes only
+            reason = 'merge diff_mode needs utf-8 encoding'
+        if reason:
+            timestamp_output(f"(WARN) {reason}, used read_mode = text")
+            settings_dict['read_mode'] = 'text'
+
+    # memory mapped files are indexed by line break byte
+    if settings_dict['file_reader'] == 'mmap' and (
+            settings_dict['encode_etl'] not in BYTES_MODE_ENCODINGS or
+            settings_dict['encode_src'] not in BYTES_MODE_ENCODINGS):
+        timestamp_output(f"(WARN) file_reader = mmap does not support "
+                         f"{settings_dict['encode_etl']}/{settings_dict['encode_src']} "
+                         f"encoding, used file_reader = stream")
+        settings_dict['file_reader'] = 'stream'
+
+    # precompile fixed width record layout
+    init_record_parser()
+
+    # checking diff patterns cache size
+    if settings_dict['diff_pattern_cache_size'] < 0:
+        timestamp_output('(ERROR) diff_pattern_cache_size must be >= 0')
+        sys_exit()
+    cf.init_deep_diff_cache(settings_dict['diff_pattern_cache_size'])
+
+    # numpy engine is optional, fall back to python compare if numpy is not installed
+    if settings_dict['compare_engine'] == 'numpy' and not cvec.is_available():
+        timestamp_output('(WARN) numpy is not installed, used compare_engine = python')
+        settings_dict['compare_engine'] = 'python'
+
     # check if record_field_names has empty names
     for i in [x.strip() for x in settings_dict['record_field_names'].split(',')]:
         if i == '':
@@ -316,18 +573,21 @@ def get_file_pairs(etls_list: list, srcs_list: list) -> list:
     res = {}
     renamed_etls_list = []
     renamed_srcs_list = []
+    files_by_renamed = {} # original file names of renamed etalons and sources
 
     timestamp_output(f"<<< checking {settings_dict['legacy_system_name']} files.. "
                      f"( using {settings_dict['etalons']})")
     for i in sorted(etls_list):
-        renamed_etls_list.append(regex_rename(os_path.split(i)[1]))
+        renamed_etls_list.append(regex_rename(cf.get_uncompressed_name(os_path.split(i)[1])))
+        files_by_renamed[('etl', renamed_etls_list[-1])] = i
     timestamp_output(f">>> found '{str(len(renamed_etls_list))} "
                      f"{settings_dict['legacy_system_name']} generated files")
 
     timestamp_output(f"<<< checking {settings_dict['new_system_name']} files.. "
                      f"( using '{settings_dict['sources']})")
     for i in sorted(srcs_list):
-        renamed_srcs_list.append(regex_rename(os_path.split(i)[1]))
+        renamed_srcs_list.append(regex_rename(cf.get_uncompressed_name(os_path.split(i)[1])))
+        files_by_renamed[('src', renamed_srcs_list[-1])] = i
     timestamp_output(f">>> found {len(renamed_srcs_list)} "
                      f"{settings_dict['new_system_name']} generated files")
 
@@ -351,7 +611,7 @@ def get_file_pairs(etls_list: list, srcs_list: list) -> list:
     timestamp_output(f">>> {len(matched)} file pairs found")
 
     for i in matched:
-        res[f"{settings_dict['etalons']}/etl_{i}"] = f"{settings_dict['sources']}/src_{i}"
+        res[files_by_renamed[('etl', i)]] = files_by_renamed[('src', i)]
     return [res, extra_etalons, extra_sources]
 
 
@@ -364,16 +624,386 @@ def line_to_record(record: str) -> list:
     if settings_dict['delimiter_type'] == 'char':
         return record.replace('\n', '').split(settings_dict['delimiter'])
     elif settings_dict['delimiter_type'] == 'fixed':
-        # generating regex for record split according record_field_sizes
-        regex_str = '^'
-        for i in settings_dict['record_field_sizes'].split(','):
-            regex_str += '(.{' + i + '})'
+        # cut fields using field slices precompiled by init_record_parser
+        line = record.replace('\n', '')
         if settings_dict['record_field_sizes_tail']:
-            regex_str += '(.+)'
-        regex_str += '\n'
+            if len(line) > fixed_record_length:
+                return [line[i].strip() for i in fixed_field_slices]
+        elif len(line) == fixed_record_length:
+            return [line[i].strip() for i in fixed_field_slices]
+        # wrong record length, whole line as a single field, goes to defective
+        return [line]
+
+
+def get_line_fields_count(record: str) -> int:
+    """returns number of fields of raw record line without splitting it
+    Args:
+        record (string): record as raw line from file
+    Returns:
+        int: number of fields line_to_record will return"""
+    if settings_dict['delimiter_type'] == 'char':
+        return record.count(settings_dict['delimiter']) + 1
+    line_length = len(record) - record.count('\n')
+    if settings_dict['record_field_sizes_tail']:
+        if line_length > fixed_record_length:
+            return len(fixed_field_slices)
+    elif line_length == fixed_record_length:
+        return len(fixed_field_slices)
+    return 1
+
+
+def bytes_line_to_record(record: bytes) -> list:
+    """splits line read in bytes read mode to fields according cdr options
+    Args:
+        record (bytes): record as raw line from file
+    Returns:
+        list: a list of record fields as bytes"""
+    line = record.rstrip(b'\r\n')
+    if settings_dict['delimiter_type'] == 'char':
+        return line.split(bytes_delimiter)
+    if settings_dict['record_field_sizes_tail']:
+        if len(line) > fixed_record_length:
+            return [line[i].strip() for i in fixed_field_slices]
+    elif len(line) == fixed_record_length:
+        return [line[i].strip() for i in fixed_field_slices]
+    return [line]
+
+
+def get_bytes_line_fields_count(record: bytes) -> int:
+    """returns number of fields of raw line read in bytes read mode without splitting it
+    Args:
+        record (bytes): record as raw line from file
+    Returns:
+        int: number of fields bytes_line_to_record will return"""
+    if settings_dict['delimiter_type'] == 'char':
+        return record.count(bytes_delimiter) + 1
+    line_length = len(record.rstrip(b'\r\n'))
+    if settings_dict['record_field_sizes_tail']:
+        if line_length > fixed_record_length:
+            return len(fixed_field_slices)
+    elif line_length == fixed_record_length:
+        return len(fixed_field_slices)
+    return 1
+
+
+def decode_line(line) -> str:
+    """returns text of raw record line, lines read in bytes read mode are decoded
+    Args:
+        line (string or bytes): raw record line
+    Returns:
+        string: record line as text read mode gives it"""
+    if isinstance(line, str):
+        return line
+    return line.decode(settings_dict['encode_etl']).replace('\r\n', '\n')
+
+
+def get_read_encoding(is_from_oldsys: bool) -> str:
+    """returns encoding to read pair file lines with
+    Args:
+        is_from_oldsys (bool):
+            True - means file is from old sys
+            False - means file is from new sys
+    Returns:
+        string: file encoding, None - lines are read as bytes"""
+    if settings_dict['read_mode'] == 'bytes':
+        return None
+    if is_from_oldsys:
+        return settings_dict['encode_etl']
+    return settings_dict['encode_src']
+
+
+def init_record_parser() -> None:
+    """precompile fixed width record layout into field slices, encode delimiter for
+       bytes read mode
+    Args:
+        None
+    Returns:
+        None: performs fixed_field_slices, fixed_record_length and bytes_delimiter init"""
+    global fixed_record_length, bytes_delimiter
+    fixed_field_slices.clear()
+    fixed_record_length = 0
+    if settings_dict['read_mode'] == 'bytes':
+        bytes_delimiter = settings_dict['delimiter'].encode(settings_dict['encode_etl'])
+    if settings_dict['delimiter_type'] != 'fixed':
+        return
+    sizes = [int(x) for x in settings_dict['record_field_sizes'].split(',')]
+    fixed_field_slices.extend(cf.get_field_slices(sizes,
+                                                  settings_dict['record_field_sizes_tail']))
+    fixed_record_length = sum(sizes)
+
+
+def init_compare_plan() -> None:
+    """compile compared fields and their comparators, excluded fields are not in plan
+    Args:
+        None
+    Returns:
+        None: performs compare_plan and compare_fields_count init"""
+    global compare_plan, compare_fields_count
+    compare_fields_count = settings_dict['number_of_fields']
+    excluded = {int(x) for x in settings_dict['excluded_fields'].replace(' ', '').split(',')
+                if x != ''}
+    comparators = {}
+    # such as '3:numeric:0.01, 1:timestamp:60:%%Y-%%m-%%d %%H:%%M:%%S, 4:trimmed', '%' of
+    # timestamp format is doubled in compare_settings.ini
+    for i in [x.strip() for x in settings_dict['field_comparators'].split(',')]:
+        if i == '':
+            continue
+        # timestamp format is the rest of value, it may have ':'
+        spec = [x.strip() for x in i.split(':', maxsplit=3)]
+        try:
+            field = int(spec[0])
+            if not 0 <= field < compare_fields_count or field in comparators:
+                raise ValueError(f"field {field} is out of number_of_fields or duplicated")
+            comparators[field] = cf.get_field_comparator(spec[1] if len(spec) > 1 else '',
+                                                         spec[2:])
+        except ValueError as err:
+            timestamp_output(f"(ERROR) wrong field_comparators value {i}: {err}")
+            sys_exit()
+    compare_plan = tuple((x, comparators.get(x)) for x in range(compare_fields_count)
+                         if x not in excluded)
+
+
+def get_key_fields_parser(is_bytes: bool):
+    """returns function to get key field values of raw record line with number_of_fields,
+       line is not split further than the last key field
+    Args:
+        is_bytes (bool): lines are read in bytes read mode
+    Returns:
+        function: func(line) returns key field values indexed by field number,
+                  None if diff keys are not set"""
+    parse_line = bytes_line_to_record if is_bytes else line_to_record
+    if settings_dict['diff_keys'] == '':
+        return None
+    last_key = max(settings_dict['diff_keys'])
+    if settings_dict['delimiter_type'] == 'char':
+        if last_key == settings_dict['number_of_fields'] - 1:
+            # the last field is a key field, line is split fully anyway
+            return parse_line
+        delimiter = bytes_delimiter if is_bytes else settings_dict['delimiter']
+
+        def get_key_fields(line):
+            # the rest of line after the last key field is one item
+            return line.split(delimiter, last_key + 1)
+        return get_key_fields
+
+    key_slices = [[i, fixed_field_slices[i]] for i in set(settings_dict['diff_keys'])]
+
+    def get_fixed_key_fields(line):
+        return {i: line[x].strip() for i, x in key_slices}
+    return get_fixed_key_fields
+
+
+def iter_file_records(filename: str, is_from_oldsys: bool, header_list: list,
+                      trailer_list: list):
+    """reads lines from file one by one, separate header, trailer from records, also
+       get key field values of lines according settings
+    Args:
+        filename (string): filename
+        is_from_oldsys (bool):
+            True - means file is from old sys
+            False - means file is from new sys
+        header_list (list): a list to collect header lines as is
+        trailer_list (list): a list to collect trailer lines as is
+    Returns:
+        generator: yields [key, key_fields, line] for each record line
+            key - concatinated key field values
+            key_fields - key field values indexed by field number, None if diff keys are
+                         not set, defective record line is splitted into fields
+            line - raw record line, bytes for read_mode = bytes"""
+    global oldsys_defective_lines
+    lines_count = []
+    encoding = get_read_encoding(is_from_oldsys)
+    parse_line = line_to_record
+    get_fields_count = get_line_fields_count
+    compose_key = cf.key_composer
+    if encoding is None:
+        parse_line = bytes_line_to_record
+        get_fields_count = get_bytes_line_fields_count
+        compose_key = cf.bytes_key_composer
+    get_key_fields = get_key_fields_parser(encoding is None)
+    number_of_fields = settings_dict['number_of_fields']
+
+    perf_counter = time.perf_counter
+    parse_time = 0.0
+    key_time = 0.0
+
+    # processing records, records are split fully at compare only
+    for n, line in enumerate(iter_record_lines(filename, encoding, header_list, trailer_list,
+                                               lines_count),
+                             settings_dict['header_records_number']):
+        start = perf_counter()
+        if get_fields_count(line) != number_of_fields:
+            key_fields = parse_line(line)
+            defective_output(['>>> defective record!'], False)
+            if is_from_oldsys:
+                oldsys_defective_lines += 1
+        elif get_key_fields is not None:
+            key_fields = get_key_fields(line)
+        else:
+            key_fields = None
+        parsed = perf_counter()
+        if settings_dict['diff_keys'] == '':
+            key = str(n)
+        else:
+            key = compose_key(key_fields, settings_dict['diff_keys'])
+        parse_time += parsed - start
+        key_time += perf_counter() - parsed
+        yield [key, key_fields, line]
+    phase_times['parsing'] += parse_time
+    phase_times['key_composition'] += key_time
+
+    # replace estimated lines count of diff pair file with real one
+    lines_num = lines_count[0]
+    if filename in raw_lines_count_by_file and raw_lines_count_by_file[filename] != lines_num:
+        delta = get_file_records_num(lines_num) - get_file_records_num(
+            raw_lines_count_by_file[filename])
+        raw_lines_count_by_file[filename] = lines_num
+        if is_from_oldsys:
+            stats_list[2] += delta
+        else:
+            stats_list[3] += delta
+
+
+def iter_record_lines(filename: str, encoding: str, header_list: list, trailer_list: list,
+                      lines_count: list):
+    """reads record lines of file, header and trailer lines are separated
+    Args:
+        filename (string): filename
+        encoding (string): file encoding, None - lines are read as bytes
+        header_list (list): a list to collect header lines as is
+        trailer_list (list): a list to collect trailer lines as is, it is filled after the
+                             last record line
+        lines_count (list): gets number of file lines after the last record line
+    Returns:
+        generator: yields raw record lines"""
+    header_lines_num = settings_dict['header_records_number']
+    trailer_lines_num = settings_dict['trailer_records_number']
+
+    if is_mapped_file(filename):
+        # header and trailer are taken by line numbers of lines index
+        start = time.perf_counter()
+        with cread.MappedLines(filename, encoding) as f:
+            phase_times['reading'] += time.perf_counter() - start
+            count = len(f)
+            first = min(header_lines_num, count)
+            last = max(count - trailer_lines_num, first)
+            header_list.extend(f.lines(0, first))
+            trailer_list.extend(f.lines(last, count))
+            yield from f.lines(first, last)
+        lines_count.append(count)
+        return
+
+    # last lines are kept back until the end of file, so trailer is known without
+    # lines count
+    trailer_buffer = deque()
+    n = -1
+    with open_file_lines(filename, encoding) as f:
+        for n, line in enumerate(f):
+            if n < header_lines_num:
+                header_list.append(line)
+                continue
+            if trailer_lines_num > 0:
+                trailer_buffer.append(line)
+                if len(trailer_buffer) <= trailer_lines_num:
+                    continue
+                line = trailer_buffer.popleft()
+            yield line
+    trailer_list.extend(trailer_buffer)
+    lines_count.append(n + 1)
+
+
+def is_mapped_file(filename: str) -> bool:
+    """check if file is read by memory mapped reader
+    Args:
+        filename (string): filename
+    Returns:
+        bool: True - file_reader = mmap and file is not compressed"""
+    return settings_dict['file_reader'] == 'mmap' and not cf.get_file_compression(filename)
+
+
+def prefetch_file(filename: str, encoding: str) -> None:
+    """start background read of file, which is going to be read next
+    Args:
+        filename (string): filename
+        encoding (string): file encoding, None - lines are read as bytes
+    Returns:
+        None: starts file reader, if read ahead is on"""
+    if (settings_dict['read_buffer_size'] > 0 and filename not in prefetch_readers and
+            not is_mapped_file(filename)):
+        prefetch_readers[filename] = cread.LinesReader(
+            filename, encoding, settings_dict['read_buffer_size'] * 1024 * 1024)
+
+
+@contextmanager
+def open_file_lines(filename: str, encoding: str):
+    """open file lines for iteration, prefetched file lines are taken from its reader
+    Args:
+        filename (string): filename
+        encoding (string): file encoding, None - lines are read as bytes
+    Returns:
+        context manager: yields iterable of file lines"""
+    prefetch_file(filename, encoding)
+    if filename not in prefetch_readers and cf.get_file_compression(filename):
+        # compressed file is decompressed in reader thread while its lines are parsed
+        prefetch_readers[filename] = cread.LinesReader(filename, encoding,
+                                                       cread.LinesReader.BLOCK_SIZE)
+    if filename not in prefetch_readers:
+        with open(filename, mode='r' if encoding else 'rb', encoding=encoding) as f:
+            yield iter_timed_lines(f)
+        return
+    reader = prefetch_readers.pop(filename)
+    try:
+        yield reader
+    finally:
+        reader.close()
+        phase_times['reading'] += reader.wait_time
+
+
+def iter_timed_lines(f):
+    """reads file lines by blocks, read time goes to reading phase
+    Args:
+        f (file): opened text or binary file
+    Returns:
+        generator: yields file lines"""
+    while True:
+        start = time.perf_counter()
+        block = f.readlines(cread.LinesReader.BLOCK_SIZE)
+        phase_times['reading'] += time.perf_counter() - start
+        if not block:
+            return
+        yield from block
+
+
+def close_prefetch_readers() -> None:
+    """stop readers of prefetched files which are not read
+    Args:
+        None
+    Returns:
+        None: performs readers stop"""
+    while prefetch_readers:
+        prefetch_readers.popitem()[1].close()
+
+
+def get_file_records_num(lines_num: int) -> int:
+    """returns number of records in file without header and trailer lines
+    Args:
+        lines_num (int): number of file lines
+    Returns:
+        int: number of record lines"""
+    return max(lines_num - settings_dict['header_records_number'] -
+               settings_dict['trailer_records_number'], 0)
+
 
-        if re_fullmatch(regex_str, record):
-            return [x.strip() for x in re_split(regex_str, record)[1:-1]]
+def get_file_lines_count(filename: str, encoding: str) -> int:
+    """returns exact or estimated number of file lines according lines_count_mode
+    Args:
+        filename (string): filename
+        encoding (string): file encoding
+    Returns:
+        int: number of file lines"""
+    if settings_dict['lines_count_mode'] == 'exact':
+        return cf.count_file_lines(filename, encoding)
+    return cf.estimate_file_lines(filename, encoding, LINES_COUNT_SAMPLE_SIZE)
 
 
 def get_records_from_file(filename: str, is_from_oldsys: bool) -> list:
@@ -386,66 +1016,94 @@ def get_records_from_file(filename: str, is_from_oldsys: bool) -> list:
             False - means file is from new sys
     Returns:
         list: [records_dict, heder_list, trailer_list]
-            records_dict - dict, a dict of lines from file transformed into list of fields
+            records_dict - RecordStore, compact store of raw record lines from file
                 key - concatinated key field values
-                value - record line splitted into fields
+                value - raw record line, split it with line_to_record or
+                        bytes_line_to_record
             header_list - list, a list of header lines as is
             trailer_list - list, a list of trailer lines as is"""
-    records_dict = {}
+    records_dict = cstore.RecordStore(b'' if settings_dict['read_mode'] == 'bytes' else '')
     header_list = []
     trailer_list = []
-    encoding = ''
-    header_lines_num = settings_dict['header_records_number']
-    trailer_lines_num = settings_dict['trailer_records_number']
-    header_indexes = []
-    trailer_indexes = []
     file_total_records = 0
 
-    if is_from_oldsys:
-        encoding = settings_dict['encode_etl']
-    else:
-        encoding = settings_dict['encode_src']
-
-    # calculating indexes of header lines
-    if header_lines_num > 0:
-        for i in range(header_lines_num):
-            header_indexes.append(i)
-
-    # calculating indexes of trailer lines
-    if trailer_lines_num > 0:
-        last_index = raw_lines_count_by_file[filename] - 1
-        for i in range(trailer_lines_num):
-            trailer_list.append(last_index)
-            last_index =- 1
-
-    # processing records
-    with open(filename, mode='r', encoding=encoding) as f:
-        for n, line in enumerate(f):
-            if n in header_indexes:
-                header_list.append(line)
-                continue
-            elif n in trailer_indexes:
-                trailer_list.append(line)
-                continue
+    for key, _, line in iter_file_records(filename, is_from_oldsys, header_list,
+                                          trailer_list):
+        if records_dict.add(key, line):
+            file_total_records += 1
+        else:
+            if is_from_oldsys:
+                stats_list[7] += 1 # add to oldsys repeats
             else:
-                rec = line_to_record(line)
-                if settings_dict['diff_keys'] == '':
-                    key = str(n)
-                else:
-                    key = cf.key_composer(rec, settings_dict['diff_keys'])
+                stats_list[8] += 1 # add to newsys repeats
+    return [records_dict, header_list, trailer_list, file_total_records]
 
-                if len(rec) != settings_dict['number_of_fields']:
-                    timestamp_output('>>> defective record!')
 
-                if key not in records_dict:
-                    records_dict[key] = rec
-                    file_total_records += 1
+def get_numeric_sort_key(values: list) -> tuple:
+    """returns sort key of key field values for merge_key_order = numeric, digit only
+       values are compared as numbers and go before other values, which are compared
+       byte-wise
+    Args:
+        values (list): key field values, strings or bytes
+    Returns:
+        tuple: sort key"""
+    return tuple((0, int(x), x) if x.isascii() and x.isdigit() else (1, 0, x) for x in values)
+
+
+def iter_sorted_file_records(filename: str, is_from_oldsys: bool):
+    """reads records from file sorted by diff keys, skips repeats, checks sort order,
+       key values are sorted byte-wise, for merge_key_order = numeric digit only key
+       values are sorted as numbers
+    Args:
+        filename (string): filename
+        is_from_oldsys (bool):
+            True - means file is from old sys
+            False - means file is from new sys
+    Returns:
+        generator: yields [sort_key, line] for each unique record
+            sort_key - tuple of key field values, line number if diff keys are not set
+            line - raw record line
+    Except:
+        UnsortedRecordsError: records are not sorted by diff keys"""
+    prev_key = None
+    file_total_records = 0
+    key_getter = None
+    order = 'byte-wise'
+    if settings_dict['diff_keys'] != '' and settings_dict['merge_key_order'] == 'numeric':
+        order = 'numeric'
+        keys_getter = itemgetter(*settings_dict['diff_keys'])
+        is_single_key = len(settings_dict['diff_keys']) == 1
+
+        def key_getter(key_fields):
+            values = keys_getter(key_fields)
+            return get_numeric_sort_key([values] if is_single_key else values)
+    elif settings_dict['diff_keys'] != '':
+        key_getter = itemgetter(*settings_dict['diff_keys'])
+
+    for key, key_fields, line in iter_file_records(filename, is_from_oldsys, [], []):
+        if key_getter is None:
+            sort_key = int(key)
+        else:
+            sort_key = key_getter(key_fields)
+        if prev_key is not None and sort_key <= prev_key:
+            if sort_key == prev_key:
+                if is_from_oldsys:
+                    stats_list[7] += 1 # add to oldsys repeats
                 else:
-                    if is_from_oldsys:
-                        stats_list[7] += 1 # add to oldsys repeats
-                    else:
-                        stats_list[8] += 1 # add to newsys repeats
-    return [records_dict, header_list, trailer_list, file_total_records]
+                    stats_list[8] += 1 # add to newsys repeats
+                continue
+            raise UnsortedRecordsError(f"{filename} is not sorted by diff keys "
+                                       f"{settings_dict['diff_keys']} in {order} order, "
+                                       f"record {line_to_record(decode_line(line))} "
+                                       f"goes after key {prev_key}")
+        prev_key = sort_key
+        file_total_records += 1
+        yield [sort_key, line]
+
+    if is_from_oldsys:
+        stats_list_curr_file[2] = file_total_records # oldsys curr file total recs
+    else:
+        stats_list_curr_file[3] = file_total_records # newsys curr file total recs
 
 
 def get_prior_keys_list(lines1: list) -> list:
@@ -504,16 +1162,15 @@ def get_unique_keys(lines: list, keys: list, excluded_keys: list) -> list:
         if key not in excluded_keys:
             left_keys.append(key)
 
-    for i in range(len(left_keys)):
-        res = left_keys[:i + 1]
-        test_set = set()
-        for line in lines:
-            tmp = ''
-            for j in res:
-                tmp += line[j]
-            test_set.add(tmp)
-        if len(test_set) == len(lines):
-            return res
+    # records with equal values of already taken keys share a group id,
+    # each next key only splits these groups, no key strings rebuild
+    group_ids = [0] * len(lines)
+    for i, key in enumerate(left_keys):
+        groups = {}
+        group_ids = [groups.setdefault((group_id, line[key]), len(groups))
+                     for group_id, line in zip(group_ids, lines)]
+        if len(groups) == len(lines):
+            return left_keys[:i + 1]
     return []
 
 
@@ -525,21 +1182,103 @@ def get_diff_keys(lines: list) -> list:
         list: a list of keys, wich gives a 100% unique combination of 
         concatinated fiels values
         This function is literally a launcher for get_unique_keys function"""
-    excluded_keys = [x.strip() for x in str(settings_dict['excluded_diff_keys']).split(',')]
+    excluded_keys = []
+    if settings_dict['excluded_diff_keys'] != '':
+        excluded_keys = cf.keys_from_str(settings_dict['excluded_diff_keys'])
     return get_unique_keys(lines, get_prior_keys_list(lines), excluded_keys)
 
 
-def save_found_keys(name: str, keys: str) -> None:
+def sample_etalon_records(files: list, count: int, scan_lines: int) -> list:
+    """reservoir sampling of records across all etalon files, files are read line by
+       line, only sampled lines are splitted into fields
+    Args:
+        files (list): a list of etalon files
+        count (int): number of records to sample
+        scan_lines (int): max number of lines to scan, shared by all files,
+            0 - scan all lines
+    Returns:
+        list: a list of sampled records without defective ones, in files order"""
+    sampler = Random(KEYS_SAMPLE_SEED)
+    reservoir = []
+    seen = 0
+    file_scan_limit = 0
+    if scan_lines > 0:
+        file_scan_limit = max(scan_lines // len(files), 1)
+
+    header_lines_num = settings_dict['header_records_number']
+    for file in sorted(files):
+        with cf.open_file(file, 'r', settings_dict['encode_etl']) as f:
+            for n, line in enumerate(f):
+                if file_scan_limit and n >= file_scan_limit + header_lines_num:
+                    break
+                if n < header_lines_num:
+                    continue
+                if len(reservoir) < count:
+                    reservoir.append([seen, line])
+                else:
+                    i = sampler.randint(0, seen)
+                    if i < count:
+                        reservoir[i] = [seen, line]
+                seen += 1
+
+    res = []
+    for _, line in sorted(reservoir):
+        rec = line_to_record(line)
+        # defective records cutoff
+        if len(rec) == settings_dict['number_of_fields']:
+            res.append(rec)
+    return res
+
+
+def get_keys_schema_fingerprint() -> str:
+    """returns fingerprint of settings found diff keys depend on
+    Args:
+        None
+    Returns:
+        string: sha1 of records layout and excluded diff keys settings"""
+    schema = [str(settings_dict[x]) for x in KEYS_SCHEMA_SETTINGS]
+    return cf.get_fingerprint(schema)
+
+
+def load_found_keys(name: str) -> dict:
+    """reads previously found diff keys
+    Args:
+        name (string): filename
+    Returns:
+        dict: keys - list of keys, schema - schema fingerprint,
+              sample - sample fingerprint. Empty dict if keys can't be read"""
+    try:
+        config_keys.read(name)
+        return {
+            'keys': cf.keys_from_str(config_keys.get('auto_generated_keys', 'keys')),
+            'schema': config_keys.get('auto_generated_keys', 'schema', fallback=''),
+            'sample': config_keys.get('auto_generated_keys', 'sample', fallback='')
+        }
+    except configparser.MissingSectionHeaderError:
+        timestamp_output(f"(WARN) cant get keys from {name}")
+    except configparser.NoSectionError:
+        timestamp_output(f"(WARN) section 'auto_generated_keys' is not found in {name}")
+    except (configparser.NoOptionError, ValueError):
+        timestamp_output(f"(WARN) keys in {name} are absent or invalid")
+    return {}
+
+
+def save_found_keys(name: str, keys: list, schema: str, sample: str) -> None:
     """create a config file with found diff keys
     Args:
         name (string): filename
-        keys (string): a list of keys as string
+        keys (list): a list of keys
+        schema (string): schema fingerprint of keys
+        sample (string): fingerprint of records sample, keys are found on
     Returns:
         None: performs save found keys to file"""
     keys = [str(item) for item in keys]
     str_keys = ','.join(keys)
-    config_keys.add_section('auto_generated_keys')
+    if not config_keys.has_section('auto_generated_keys'):
+        config_keys.add_section('auto_generated_keys')
     config_keys.set('auto_generated_keys', 'keys', str_keys)
+    config_keys.set('auto_generated_keys', 'schema', schema)
+    config_keys.set('auto_generated_keys', 'sample', sample)
     with open(name, 'w', encoding='utf-8') as f:
         config_keys.write(f)
 
@@ -564,61 +1303,46 @@ def check_key_overlimit(key_str: str) -> bool:
 
 
 def stat_out(stats_lst: list, start_t: float, field_names: list) -> None:
-    """printing stats to console
+    """printing stats to console or progress lines to log
     Args:
         stats_lst (list): a list of values
         start_t (float): a script start time
         fiels_names (list): a list of record field names
     Returns:
-        None: performs a console print of detailed, tabulated stats
+        None: performs a console redraw of detailed, tabulated stats, for progress_mode = log
+        appends progress line to log every progress_log_interval seconds
         This function also performs finishing operations on diff complete or user interrupt"""
-
+    global stat_screen_flag
+    is_console = settings_dict['progress_mode'] == 'console'
+    if is_console:
+        cf.init_ansi_console()
+        stat_screen_flag = True
+    logged = time.time()
     while not thread_break_flag:
-        cf.clear_screen()
-        print()
-        print(f"Diff tag : {settings_dict['diff_name']} │ ", end='')
-        print('Time left: ', end='')
-        print(f"{cf.calculate_estimated_time(stats_list[16], stats_list[2], start_t)} │ ", end='')
-        print(f"{stats_list[15]} │", end='')
-        print('Press Ctrl+C once to interrupt diff!')
-        print('─' * 148)
-        cf.progress_bar(stats_lst[1], stats_lst[0], 'Files:',
-                     f"Keys = {settings_dict['diff_keys']}",
-                     f"Excluded keys = {settings_dict['excluded_diff_keys']}",
-                     f"Excluded fields = {settings_dict['excluded_fields']}")
-        print()
-        print('─' * 148)
-        cf.progress_bar(stats_lst[12], stats_lst[11], 'Diff pair records:',
-                     f"Diff pair = {stats_list[13]}")
-        print()
-        print()
-        report_print(stats_list, False, field_names)
-        time.sleep(3) # stat refresh delay
+        if is_console:
+            cf.redraw_screen(get_stat_frame(stats_lst, start_t, field_names, False))
+        elif time.time() - logged >= settings_dict['progress_log_interval']:
+            logged = time.time()
+            timestamp_output(get_progress_line(start_t))
+            logfile.flush()
+        time.sleep(STAT_REFRESH_DELAY)
+    stat_screen_flag = False
     if interrupt_flag:
         stats_list[15] = 'Diff process interrupted by user'
+    elif error_flag:
+        stats_list[15] = 'Diff process stopped on error'
     else:
         stats_list[15] = 'Diff process complete'
-    cf.clear_screen()
-    print()
-    print(f"Diff tag : {settings_dict['diff_name']} │ ", end='')
-    print('Time left: ', end='')
-    print(f"{cf.calculate_estimated_time(stats_list[1], stats_list[0], start_t)} │ ", end='')
-    print(f"{stats_list[15]}")
-    print('─' * 148)
-    cf.progress_bar(stats_lst[1], stats_lst[0], 'Files:',
-                 f"Keys = {settings_dict['diff_keys']}",
-                 f"Excluded keys = {settings_dict['excluded_diff_keys']}",
-                 f"Excluded fields = {settings_dict['excluded_fields']}")
-    print()
-    print('─' * 148)
-    cf.progress_bar(stats_lst[11], stats_lst[11], 'Diff pair records',
-                 f"Diff pair = {stats_list[13]}")
-    print()
-    print()
-    report_print(stats_list, True, field_names)
+    if is_console:
+        cf.redraw_screen(get_stat_frame(stats_lst, start_t, field_names, True))
+    else:
+        timestamp_output(get_progress_line(start_t))
+        print(get_stat_frame(stats_lst, start_t, field_names, True), end='')
 
     if interrupt_flag:
         timestamp_output('(STOP) Interrupted by user')
+    elif error_flag:
+        timestamp_output('(STOP) Diff process stopped on error')
     else:
         timestamp_output('(INFO) Diff process complete.')
     time_spent = round(time.time() - start_t, 4)
@@ -627,29 +1351,83 @@ def stat_out(stats_lst: list, start_t: float, field_names: list) -> None:
 
     # closing report files
     timestamp_output('<<< closing report files')
-    for i in errored_fields_set:
-        rep_file_name = ''
-        if i == 'defective':
-            rep_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}/"
-                                    f"!!!_defective.rep")
-        else:
-            rep_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}/"
-                                 f"{str(i).zfill(3)}_{field_names[i]}.rep")
-        rep_file = open(rep_file_name, 'a+', encoding='utf-8')
-        rep_file.close()
+    if report_writer is not None:
+        report_writer.close()
     timestamp_output('>>> closing report files done')
 
     timestamp_output('<<< moving log file')
     timestamp_output('<<< stopping script')
 
     # closing log file
+    log_files = logfile.get_file_names()
     logfile.close()
 
-    # moving logfile to result dir
-    move(f"{LOGFILE_NAME}", f"{settings_dict['diff_out_dir']}{settings_dict['diff_name']}")
+    # moving logfile and rotated log files to result dir
+    for i in log_files:
+        move(i, f"{settings_dict['diff_out_dir']}{settings_dict['diff_name']}")
 
 
-def report_print(values_list: list, is_total: bool, field_names: list) -> None:
+def get_stat_frame(stats_lst: list, start_t: float, field_names: list,
+                   is_total: bool) -> str:
+    """returns stats table as text, so the whole screen is written at once
+    Args:
+        stats_lst (list): a list of values
+        start_t (float): a script start time
+        field_names (list): a list of record field names
+        is_total (bool):
+            True - final stats of complete or interrupted diff
+            False - live stats of running diff
+    Returns:
+        string: stats lines"""
+    frame = StringIO()
+    print(file=frame)
+    print(f"Diff tag : {settings_dict['diff_name']} │ ", end='', file=frame)
+    print('Time left: ', end='', file=frame)
+    if is_total:
+        print(f"{cf.calculate_estimated_time(stats_list[1], stats_list[0], start_t)} │ ",
+              end='', file=frame)
+        print(f"{stats_list[15]}", file=frame)
+    else:
+        print(f"{cf.calculate_estimated_time(stats_list[16], stats_list[2], start_t)} │ ",
+              end='', file=frame)
+        print(f"{stats_list[15]} │", end='', file=frame)
+        print('Press Ctrl+C once to interrupt diff!', file=frame)
+    print('─' * 148, file=frame)
+    cf.progress_bar(stats_lst[1], stats_lst[0], 'Files:',
+                 f"Keys = {settings_dict['diff_keys']}",
+                 f"Excluded keys = {settings_dict['excluded_diff_keys']}",
+                 f"Excluded fields = {settings_dict['excluded_fields']}",
+                 f"Field comparators = {settings_dict['field_comparators']}", file=frame)
+    print(file=frame)
+    print('─' * 148, file=frame)
+    if is_total:
+        cf.progress_bar(stats_lst[11], stats_lst[11], 'Diff pair records',
+                     f"Diff pair = {stats_list[13]}", file=frame)
+    else:
+        cf.progress_bar(stats_lst[12], stats_lst[11], 'Diff pair records:',
+                     f"Diff pair = {stats_list[13]}", file=frame)
+    print(file=frame)
+    print(file=frame)
+    report_print(stats_list, is_total, field_names, file=frame)
+    return frame.getvalue()
+
+
+def get_progress_line(start_t: float) -> str:
+    """returns compact progress info for headless progress mode
+    Args:
+        start_t (float): a script start time
+    Returns:
+        string: progress line for log"""
+    elapsed = time.time() - start_t
+    rate = round(stats_list[16] / elapsed) if elapsed > 0 else 0
+    return (f"(PROGRESS) pairs {stats_list[1]}/{stats_list[0]}, "
+            f"records {stats_list[16]}/{stats_list[2]}, {rate} rec/s, "
+            f"ETA {cf.calculate_estimated_time(stats_list[16], stats_list[2], start_t)}, "
+            f"losts {stats_list[5]}, extras {stats_list[6]}, broken {stats_list[17]}, "
+            f"defective {stats_list[14]} | {stats_list[15]}")
+
+
+def report_print(values_list: list, is_total: bool, field_names: list, file=None) -> None:
     """Printing diff report
     Args:
         values_list (list): stats list to output
@@ -657,6 +1435,7 @@ def report_print(values_list: list, is_total: bool, field_names: list) -> None:
             True - output a report table, styled for TOTAL with header, double lines border
             False - output a report table without header, single line border
         field_names (list): a list of record field names
+        file (file object): output stream, None - sys.stdout
     Returns:
         None: perform a console print of report table"""
 
@@ -666,67 +1445,68 @@ def report_print(values_list: list, is_total: bool, field_names: list) -> None:
 
     if is_total:
         # print double line header with TOTAL
-        print(f"╒{'═' * 25}╤{'═' * 24}╤{'═' * 21}╤[ TOTAL ]{'═' * 12}╤", end='')
-        print(f"{'═' * 29}╤{'═' * 21}╕")
+        print(f"╒{'═' * 25}╤{'═' * 24}╤{'═' * 21}╤[ TOTAL ]{'═' * 12}╤", end='', file=file)
+        print(f"{'═' * 29}╤{'═' * 21}╕", file=file)
     else:
         # print single line header without TOTAL
-        print(f"┌{'─' * 25}┬{'─' * 24}┬{'─' * 21}┬{'─' * 21}┬{'─' * 29}┬", end='')
-        print(f"{'─' * 21}┐")
+        print(f"┌{'─' * 25}┬{'─' * 24}┬{'─' * 21}┬{'─' * 21}┬{'─' * 29}┬", end='', file=file)
+        print(f"{'─' * 21}┐", file=file)
     # print column names
-    print(f"│ {'Total records':23s} │ ", end='')
-    print(f"{'Unmatched/Matched recs':22s} │ ", end='')
-    print(f"{'Lost/Extra records':19s} │ ", end='')
-    print(f"{'Record repeats':19s} │ ", end='')
-    print(f"{'Defective/Broken records':27s} │ ", end='')
-    print(f"{'Identical records':19s} │ ")
+    print(f"│ {'Total records':23s} │ ", end='', file=file)
+    print(f"{'Unmatched/Matched recs':22s} │ ", end='', file=file)
+    print(f"{'Lost/Extra records':19s} │ ", end='', file=file)
+    print(f"{'Record repeats':19s} │ ", end='', file=file)
+    print(f"{'Defective/Broken records':27s} │ ", end='', file=file)
+    print(f"{'Identical records':19s} │ ", file=file)
 
     # print values
     ## 1st row
     # OldSys recs
     print(f"│ {settings_dict['legacy_system_name'][:10]:10}: {values_list[2]:>11} │ ",
-          end='')
+          end='', file=file)
     #print(f"{'':22} │ ", end='') # blank for matched column
     print(cf.get_val_with_percents(values_list[2], (values_list[5] + values_list[6] +
-                          values_list[7] + values_list[8]), '>22'), '│', end='')
+                          values_list[7] + values_list[8]), '>22'), '│', end='', file=file)
     # Lost recs (%)
-    print(cf.get_val_with_percents(values_list[2], values_list[5], '>20'), '│', end='')
+    print(cf.get_val_with_percents(values_list[2], values_list[5], '>20'), '│', end='', file=file)
     # OldSys repeats (%)
-    print(cf.get_val_with_percents(values_list[2], values_list[7], '>20'), '│', end='')
+    print(cf.get_val_with_percents(values_list[2], values_list[7], '>20'), '│', end='', file=file)
     # Defective recs (%)
-    print(cf.get_val_with_percents(values_list[2], values_list[14], '>28'), '│', end='')
-    print(f"{'':20} │ ", end='') # blank for identical column
-    print()
+    print(cf.get_val_with_percents(values_list[2], values_list[14], '>28'), '│', end='', file=file)
+    print(f"{'':20} │ ", end='', file=file) # blank for identical column
+    print(file=file)
 
     ## 2nd row
     # NewSys recs
-    print(f"│ {settings_dict['new_system_name'][:10]:10}: {values_list[3]:>11} │ ", end='')
+    print(f"│ {settings_dict['new_system_name'][:10]:10}: {values_list[3]:>11} │ ",
+          end='', file=file)
     # Matched (%)
-    print(cf.get_val_with_percents(values_list[2], values_list[4], '>22'), '│', end='')
+    print(cf.get_val_with_percents(values_list[2], values_list[4], '>22'), '│', end='', file=file)
     # Extra recs (%)
-    print(cf.get_val_with_percents(values_list[2], values_list[6], '>20'), '│', end='')
+    print(cf.get_val_with_percents(values_list[2], values_list[6], '>20'), '│', end='', file=file)
     # NewSys repeats (%)
-    print(cf.get_val_with_percents(values_list[2], values_list[8], '>20'), '│', end='')
+    print(cf.get_val_with_percents(values_list[2], values_list[8], '>20'), '│', end='', file=file)
     # Broken attrs (%)
     # print(cf.get_val_with_percents(values_list[2], values_list[9], '>28'), '│', end='')
-    print(cf.get_val_with_percents(values_list[2], values_list[17], '>28'), '│', end='')
+    print(cf.get_val_with_percents(values_list[2], values_list[17], '>28'), '│', end='', file=file)
     # Identical resc (%)
-    print(cf.get_val_with_percents(values_list[2], values_list[10], '>20'), '│', end='')
-    print()
+    print(cf.get_val_with_percents(values_list[2], values_list[10], '>20'), '│', end='', file=file)
+    print(file=file)
 
     # Optional bottom double line for 'TOTAL'
     if is_total:
-        print(f"╘{'═' * 25}╧{'═' * 24}╧{'═' * 21}╧{'═' * 21}╧{'═' * 29}", end='')
-        print(f"╧{'═' * 21}╛")
+        print(f"╘{'═' * 25}╧{'═' * 24}╧{'═' * 21}╧{'═' * 21}╧{'═' * 29}", end='', file=file)
+        print(f"╧{'═' * 21}╛", file=file)
     else:
-        print(f"└{'─' * 25}┴{'─' * 24}┴{'─' * 21}┴{'─' * 21}┴{'─' * 29}", end='')
-        print(f"┴{'─' * 21}┘")
+        print(f"└{'─' * 25}┴{'─' * 24}┴{'─' * 21}┴{'─' * 21}┴{'─' * 29}", end='', file=file)
+        print(f"┴{'─' * 21}┘", file=file)
 
     if fields_error_dict.keys():
-        print(f"{'Field errors':<39}: {stats_list[9]}")
-        print('─' * 45)
+        print(f"{'Field errors':<39}: {stats_list[9]}", file=file)
+        print('─' * 45, file=file)
         for k, v in sorted(fields_error_dict.items()):
-            print(f"{k:>3} {field_names[k]:<35}: {v}")
-        print()
+            print(f"{k:>3} {field_names[k]:<35}: {v}", file=file)
+        print(file=file)
 
 
 def diff(file_pairs: dict, field_names: list) -> None:
@@ -738,163 +1518,86 @@ def diff(file_pairs: dict, field_names: list) -> None:
         field_names (list): a list of record field names
     Returns:
         None: performs all diff processes"""
-    global thread_break_flag
-    err_threshold_to_write = 0 # for faster err report write
-    # write settings report
-    report_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}/"
-                       f"diff_settings.rep")
-    report_file = open(report_file_name, 'a+', encoding='utf-8')
-
-    for k, v in settings_dict.items():
-        if v == '\t':
-            report_file.write(f"{k}: \\t\n")
-        else:
-            report_file.write(f"{k}: {v}\n")
-    report_file.close()
-
+    diff_start = time.perf_counter()
     stats_list[0] = len(file_pairs) # for total files stat
 
-    # start diff processing
-    detailed_errors_dict = {}
-    for k, v in file_pairs.items():
-        if thread_break_flag:
-            break
+    if os_path.exists(f"{report_dir}/{CHECKPOINT_FILE_NAME}"):
+        # resumed diff, skip completed pairs and take their saved stats
+        done_pairs = restore_checkpoint()
+        file_pairs = {k: v for k, v in file_pairs.items() if k not in done_pairs}
+        timestamp_output(f"(INFO) resuming diff, {len(done_pairs)} pairs are already done, "
+                         f"{len(file_pairs)} pairs left")
+    else:
+        done_pairs = set()
+        # write settings report
+        report_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}/"
+                           f"diff_settings.rep")
+        report_file = open(report_file_name, 'a+', encoding='utf-8')
 
-        stats_list[11] = 0
-        stats_list[12] = 0
-        tmp_headers = []
-        tmp_tralers = []
-
-        # reset curr file rec stats
-        for n, i in enumerate(stats_list_curr_file):
-            if isinstance(i, int):
-                stats_list_curr_file[n] = 0
-            elif isinstance(i, str):
-                stats_list_curr_file[n] = ''
-
-        # current pair filenames to stat
-        stats_list[13] = f"{k.split('/')[-1]} / {v.split('/')[-1]}"
-        stats_list_curr_file[13] = stats_list[13]
-
-        # get oldsys records
-        stats_list[15] = f"reading {settings_dict['legacy_system_name']} records.."
-        oldsys_records, tmp_headers, tmp_tralers, file_records_num = get_records_from_file(k, True)
-        stats_list[11] = file_records_num # current file records number
-        stats_list_curr_file[2] = stats_list[11] # oldsys curr file total recs
-
-        # get newsys records
-        stats_list[15] = f"reading {settings_dict['new_system_name']} records.."
-        # timestamp_output(f"<<< reading {settings_dict['new_system_name']} records)")
-        newsys_records, tmp_headers, tmp_tralers, file_records_num = get_records_from_file(v, False)
-        stats_list_curr_file[3] = file_records_num # newsys curr file total recs
-
-        # timestamp_output(f">>> reading {settings_dict['new_system_name']} records) done")
-        tmp_headers = []
-        tmp_tralers = []
-
-        # count matched, lost, extra records
-        stats_list[15] = 'calculating matched, lost, extra records..'
-        matched_recs_by_key = oldsys_records.keys() & newsys_records.keys()
-        lost_recs = oldsys_records.keys() - newsys_records.keys()
-        extra_recs = newsys_records.keys() - oldsys_records.keys()
-        stats_list[4] += len(matched_recs_by_key) # to matched out
-        stats_list_curr_file[4] = len(matched_recs_by_key)
-        stats_list[5] += len(lost_recs) # to losts out
-        stats_list_curr_file[5] = len(lost_recs) # to losts out
-        stats_list[6] += len(extra_recs) # to extras out
-        stats_list_curr_file[6] = len(extra_recs) # to extras out
-
-        # write reports for losts and extras
-        stats_list[15] = 'writing lost and extra reports..'
-        if lost_recs:
-            rep_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}"
-                             f"/!!_losts.rep")
-            for i in lost_recs:
-                rep_file = open(rep_file_name, 'a+', encoding='utf-8')
-                rep_str = f"{stats_list[13]}:\n{oldsys_records[i]}\n\n"
-                rep_file.write(rep_str)
-        if extra_recs:
-            rep_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}"
-                             f"/!_extras.rep")
-            for i in extra_recs:
-                rep_file = open(rep_file_name, 'a+', encoding='utf-8')
-                rep_str = f"{stats_list[13]}:\n{newsys_records[i]}\n\n"
-                rep_file.write(rep_str)
-
-        # diff records
-        stats_list[15] = 'processing diff..'
-        for i in matched_recs_by_key:
-            if thread_break_flag:
-                break
-            res = compare_records(oldsys_records[i], newsys_records[i])
-            if res[0]:
-                stats_list[17] += 1 # add total broken record
-                stats_list_curr_file[17] += 1 # add current broken record
-
-            # write error reports
-            for k, v in res[0].items():
-                errored_fields_set.add(k) # for closing report files
-                rep_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}/"
-                                f"{str(k).zfill(3)}_{field_names[k]}.rep")
-                if rep_file_name not in detailed_errors_dict:
-                    detailed_errors_dict[rep_file_name] = [v]
-                    err_threshold_to_write += 1
-                else:
-                    detailed_errors_dict[rep_file_name].append(v)
-                    err_threshold_to_write += 1
-
-            # check err_threshold_to_write, dump data to report if needed
-            if err_threshold_to_write > 5000:
-                for k, v in detailed_errors_dict.items():
-                    cf.write_to_file(k, v)
-                detailed_errors_dict.clear()
-                err_threshold_to_write = 0
-
-            # write defective reports
-            if res[1]:
-                errored_fields_set.add('defective') # for closing defective report file
-                rep_file_name = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}/"
-                                    f"!!!_defective.rep")
-                rep_file = open(rep_file_name, 'a+', encoding='utf-8')
-                for j in res[1]:
-                    rep_file.write(j)
-            stats_list[12] += 1 # current record
-            stats_list[16] += 1 # curr rec for estimated
+        for k, v in settings_dict.items():
+            if v == '\t':
+                report_file.write(f"{k}: \\t\n")
+            else:
+                report_file.write(f"{k}: {v}\n")
+        report_file.close()
+        save_checkpoint({'start': True})
 
-        # final write error data from detailed_errors_dict to report
-        for k, v in detailed_errors_dict.items():
-            cf.write_to_file(k, v)
-        detailed_errors_dict.clear()
-        stats_list[1] += 1 # current file pair number
+    global result_store
+    if settings_dict['result_db']:
+        result_store = cdb.ResultStore(f"{report_dir}/{RESULT_DB_FILE_NAME}",
+                                       RESULT_DB_BUFFER_ROWS)
+        result_store.keep_pairs(done_pairs)
+        result_store.set_fields(field_names)
 
-        # write current file info
-        curr_file_stats = '\t'.join([
-                # filename
-                f"{stats_list_curr_file[13]:<26}",
-                # old sys records
-                f"{stats_list_curr_file[2]:<20}",
-                # new sys records
-                f"{stats_list_curr_file[3]:<20}",
-                # Matched records
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[4], '<20'),
-                # Lost records
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[5], '<20'),
-                # Extra records
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[6], '<20'),
-                # old sys repeats
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[7], '<20'),
-                # new sys repeats
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[8], '<20'),
-                # broren records
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[17], '<20'),
-                # broken attributes
-                f"{stats_list_curr_file[9]:<20}",
-                # defective records
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[14], '<20'),
-                # identical records
-                cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[10], '<20')])
-        cf.write_to_file(f"{settings_dict['diff_out_dir']}"
-                        f"/{settings_dict['diff_name']}/diff_result.txt", [curr_file_stats + '\n'])
+    if settings_dict['pair_cache']:
+        file_pairs = apply_pair_cache(file_pairs)
+
+    # start diff processing
+    global error_flag, report_writer
+    report_writer = crep.ReportWriter(settings_dict['report_buffer_size'] * 1024 * 1024)
+    try:
+        if settings_dict['workers_count'] > 1:
+            diff_in_pool(file_pairs, field_names)
+        else:
+            pairs = list(file_pairs.items())
+            for n, (k, v) in enumerate(pairs):
+                if thread_break_flag:
+                    break
+                if n + 1 < len(pairs):
+                    # next pair is read ahead while current pair is diffed
+                    prefetch_file(pairs[n + 1][0], get_read_encoding(True))
+                counters = get_counters()
+                files_before = get_result_files_sizes()
+                diff_pair(k, v, field_names)
+                if not thread_break_flag:
+                    report_writer.flush()
+                    counters = get_counters_delta(counters)
+                    save_checkpoint({'pair': [k, v], 'counters': counters,
+                                     'lines': get_pair_lines_count(k, v)})
+                    if settings_dict['pair_cache']:
+                        save_pair_cache(k, counters, files_before)
+    except UnsortedRecordsError as err:
+        timestamp_output(f"(ERROR) {err}")
+        timestamp_output('(ERROR) use diff_mode = dict for unsorted files or '
+                         'merge_key_order = numeric for files sorted by number keys, '
+                         'stopping diff')
+        error_flag = True
+    if settings_dict['cross_file_match'] and not thread_break_flag and not error_flag:
+        match_moved_records(field_names)
+    report_writer.close()
+    close_prefetch_readers()
+    if result_store is not None:
+        result_store.close(True)
+    if not thread_break_flag and not error_flag:
+        save_checkpoint({'complete': True})
+        # unmatched records are kept for resume only, complete diff is not resumed
+        if os_path.exists(f"{report_dir}/{UNMATCHED_FILE_NAME}"):
+            os_remove(f"{report_dir}/{UNMATCHED_FILE_NAME}")
+
+    cache_stats = [x + y for x, y in zip(cf.get_deep_diff_cache_stats(),
+                                         pool_deep_diff_cache_stats)]
+    timestamp_output(f"(INFO) diff patterns cache: hits {cache_stats[0]}, "
+                     f"misses {cache_stats[1]}, evictions {cache_stats[2]}")
 
     # write top 10 field errors
     rep_file_name = (f"{settings_dict['diff_out_dir']}"
@@ -904,7 +1607,8 @@ def diff(file_pairs: dict, field_names: list) -> None:
         n_cnt = 0
         rep_file.write('\n')
         rep_file.write(f"{k} {field_names[k]}:\n")
-        for k1, v1 in sorted(v.items(), key=lambda item: item[1], reverse=True ):
+        # equal counts are ordered by pattern, top does not depend on pairs merge order
+        for k1, v1 in sorted(v.items(), key=lambda item: (-item[1], item[0])):
             if n_cnt == 10:
                 break
             rep_file.write(f"{k1:<40} : {v1}\n")
@@ -941,6 +1645,995 @@ def diff(file_pairs: dict, field_names: list) -> None:
                    cf.get_val_with_percents(stats_list[2], stats_list[10], '<20')])
     cf.write_to_file(f"{settings_dict['diff_out_dir']}"
                   f"/{settings_dict['diff_name']}/diff_result.txt", final_stats + '\n')
+    write_metrics(time.perf_counter() - diff_start)
+
+
+def diff_pair(k: str, v: str, field_names: list) -> None:
+    """diff a single pair of files, update stats and write pair reports
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+        field_names (list): a list of record field names
+    Returns:
+        None: performs diff of one file pair"""
+    global defective_log_count, defective_lines_log_count, oldsys_defective_lines
+    pair_start = time.perf_counter()
+    stats_list[11] = 0
+    stats_list[12] = 0
+    defective_log_count = 0
+    defective_lines_log_count = 0
+    oldsys_defective_lines = 0
+    for i in PHASES:
+        phase_times[i] = 0.0
+
+    # reset curr file rec stats
+    for n, i in enumerate(stats_list_curr_file):
+        if isinstance(i, int):
+            stats_list_curr_file[n] = 0
+        elif isinstance(i, str):
+            stats_list_curr_file[n] = ''
+
+    # current pair filenames to stat
+    stats_list[13] = f"{k.split('/')[-1]} / {v.split('/')[-1]}"
+    stats_list_curr_file[13] = stats_list[13]
+    global result_pair_id
+    if result_store is not None:
+        result_pair_id = result_store.add_pair(stats_list[13], k, v)
+
+    if settings_dict['diff_mode'] == 'merge':
+        pair_records = get_merged_pair_records(k, v)
+    elif is_spilled_pair(k):
+        pair_records = get_spilled_pair_records(k, v)
+    else:
+        pair_records = get_dict_pair_records(k, v)
+
+    # diff records, numpy engine compares matched records in batches, in bytes read mode
+    # identical records are never decoded, number of fields of identical lines is checked
+    # only if old sys file has defective lines
+    get_fields_count = get_line_fields_count
+    if settings_dict['read_mode'] == 'bytes':
+        get_fields_count = get_bytes_line_fields_count
+    perf_counter = time.perf_counter
+    records_time = 0.0 # time spent in pair records generator
+    compare_time = 0.0
+    report_time = 0.0
+    batch = []
+    start = perf_counter()
+    for event, etl_line, src_line in pair_records:
+        got = perf_counter()
+        records_time += got - start
+        if thread_break_flag:
+            break
+        results = []
+        if event == 'lost':
+            stats_list[5] += 1 # to losts out
+            stats_list_curr_file[5] += 1 # to losts out
+            write_unmatched_record('lost', decode_line(etl_line))
+        elif event == 'extra':
+            stats_list[6] += 1 # to extras out
+            stats_list_curr_file[6] += 1 # to extras out
+            write_unmatched_record('extra', decode_line(src_line))
+        elif etl_line == src_line and (not oldsys_defective_lines or
+                                       get_fields_count(etl_line) ==
+                                       settings_dict['number_of_fields']):
+            # identical raw lines, no need to split and compare fields
+            stats_list[4] += 1 # to matched out
+            stats_list_curr_file[4] += 1
+            stats_list[10] += 1 # add identical
+            stats_list_curr_file[10] += 1 # add identical curr file stats
+        elif settings_dict['compare_engine'] == 'numpy':
+            stats_list[4] += 1 # to matched out
+            stats_list_curr_file[4] += 1
+            batch.append([line_to_record(decode_line(etl_line)),
+                          line_to_record(decode_line(src_line))])
+            if len(batch) == COMPARE_BATCH_SIZE:
+                results = list(zip(batch, compare_records_batch(batch)))
+                batch = []
+        else:
+            stats_list[4] += 1 # to matched out
+            stats_list_curr_file[4] += 1
+            recs = [line_to_record(decode_line(etl_line)), line_to_record(decode_line(src_line))]
+            results = [[recs, compare_records(recs[0], recs[1])]]
+
+        compared = perf_counter()
+        for recs, res in results:
+            write_compare_result(res, recs, field_names)
+        if event != 'extra':
+            stats_list[12] += 1 # current record
+            stats_list[16] += 1 # curr rec for estimated
+        start = perf_counter()
+        if event == 'matched':
+            compare_time += compared - got
+            report_time += start - compared
+        else:
+            report_time += start - got # losts and extras reports
+    records_time += perf_counter() - start
+
+    if batch:
+        start = perf_counter()
+        results = list(zip(batch, compare_records_batch(batch)))
+        compared = perf_counter()
+        for recs, res in results:
+            write_compare_result(res, recs, field_names)
+        compare_time += compared - start
+        report_time += perf_counter() - compared
+
+    stats_list[1] += 1 # current file pair number
+    if settings_dict['defective_log_limit'] and \
+            defective_log_count > settings_dict['defective_log_limit']:
+        timestamp_output(f"(WARN) {stats_list[13]}: messages of "
+                         f"{defective_log_count - settings_dict['defective_log_limit']} "
+                         f"more defective records are not logged, see !!!_defective.rep")
+    if settings_dict['defective_log_limit'] and \
+            defective_lines_log_count > settings_dict['defective_log_limit']:
+        timestamp_output(f"(WARN) {stats_list[13]}: messages of "
+                         f"{defective_lines_log_count - settings_dict['defective_log_limit']} "
+                         f"more defective lines are not logged")
+
+    # write current file info
+    curr_file_stats = '\t'.join([
+            # filename
+            f"{stats_list_curr_file[13]:<26}",
+            # old sys records
+            f"{stats_list_curr_file[2]:<20}",
+            # new sys records
+            f"{stats_list_curr_file[3]:<20}",
+            # Matched records
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[4], '<20'),
+            # Lost records
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[5], '<20'),
+            # Extra records
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[6], '<20'),
+            # old sys repeats
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[7], '<20'),
+            # new sys repeats
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[8], '<20'),
+            # broren records
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[17], '<20'),
+            # broken attributes
+            f"{stats_list_curr_file[9]:<20}",
+            # defective records
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[14], '<20'),
+            # identical records
+            cf.get_val_with_percents(stats_list_curr_file[2], stats_list_curr_file[10], '<20')])
+    cf.write_to_file(f"{report_dir}/diff_result.txt", [curr_file_stats + '\n'])
+    if result_store is not None:
+        result_store.set_pair_stats(result_pair_id, [stats_list_curr_file[x] for x in
+                                                     (2, 3, 4, 5, 6, 7, 8, 17, 9, 14, 10)])
+
+    # records generator time is reading, parsing, key composition and matching of records,
+    # compare time includes split of matched records and pattern diff of broken fields
+    phase_times['set_operations'] = max(records_time - phase_times['reading'] -
+                                        phase_times['parsing'] -
+                                        phase_times['key_composition'], 0.0)
+    phase_times['compare'] = max(compare_time - phase_times['pattern_diff'], 0.0)
+    phase_times['report_writing'] = report_time
+    pairs_metrics.append(get_pair_metrics(k, v, time.perf_counter() - pair_start))
+
+
+def get_pair_metrics(k: str, v: str, seconds: float) -> dict:
+    """returns metrics of diffed pair, pair phases time is added to total phases time
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+        seconds (float): pair diff time
+    Returns:
+        dict: pair metrics for metrics file"""
+    for i in PHASES:
+        total_phase_times[i] += phase_times[i]
+    records = stats_list_curr_file[2] + stats_list_curr_file[3]
+    data_bytes = os_path.getsize(k) + os_path.getsize(v)
+    return {'pair': [k, v],
+            'seconds': round(seconds, 4),
+            'records': records,
+            'bytes': data_bytes,
+            'records_per_sec': round(records / seconds, 1) if seconds else None,
+            'bytes_per_sec': round(data_bytes / seconds, 1) if seconds else None,
+            'phases': {x: round(phase_times[x], 4) for x in PHASES if phase_times[x]}}
+
+
+def write_metrics(seconds: float) -> None:
+    """write run metrics file next to diff_result.txt
+    Args:
+        seconds (float): diff time
+    Returns:
+        None: performs metrics file write"""
+    records = sum(x['records'] for x in pairs_metrics)
+    data_bytes = sum(x['bytes'] for x in pairs_metrics)
+    if interrupt_flag or thread_break_flag:
+        status = 'interrupted'
+    elif error_flag:
+        status = 'error'
+    else:
+        status = 'complete'
+    with open(f"{report_dir}/{METRICS_FILE_NAME}", 'w', encoding='utf-8') as f:
+        json.dump({'diff_name': settings_dict['diff_name'],
+                   'status': status,
+                   'pairs_total': stats_list[0],
+                   'pairs_diffed': len(pairs_metrics),
+                   'seconds': round(seconds, 4),
+                   'records': records,
+                   'bytes': data_bytes,
+                   'records_per_sec': round(records / seconds, 1) if seconds else None,
+                   'bytes_per_sec': round(data_bytes / seconds, 1) if seconds else None,
+                   'phases': {x: round(total_phase_times[x], 4) for x in PHASES},
+                   'pairs': pairs_metrics}, f, indent=2)
+
+
+def write_unmatched_record(side: str, line: str, is_report: bool = False) -> None:
+    """write lost or extra record report, for cross file match record is kept for
+       match_moved_records
+    Args:
+        side (string): 'lost' or 'extra'
+        line (string): raw record line
+        is_report (bool): write report even for cross file match, record is not moved
+    Returns:
+        None: performs buffered report write"""
+    if settings_dict['cross_file_match'] and not is_report:
+        report_writer.write(f"{report_dir}/{UNMATCHED_FILE_NAME}", json.dumps(
+            [side, stats_list[13], line], ensure_ascii=False, separators=(',', ':')) + '\n')
+        return
+    rec = line_to_record(line)
+    if side == 'lost':
+        report_writer.write(f"{report_dir}/!!_losts.rep", f"{stats_list[13]}:\n{rec}\n\n")
+    else:
+        report_writer.write(f"{report_dir}/!_extras.rep", f"{stats_list[13]}:\n{rec}\n\n")
+    if result_store is not None:
+        result_store.add('losts' if side == 'lost' else 'extras', result_pair_id,
+                         [get_result_key(rec), cdb.get_record(rec)])
+
+
+def match_moved_records(field_names: list) -> None:
+    """match lost and extra records of the same key from different pairs, such records
+       moved to other file are compared as matched, the rest go to losts and extras reports
+    Args:
+        field_names (list): a list of record field names
+    Returns:
+        None: performs stats update and reports write"""
+    f_name = f"{report_dir}/{UNMATCHED_FILE_NAME}"
+    if not os_path.exists(f_name):
+        return
+    stats_list[15] = 'matching records moved between files..'
+    timestamp_output('<<< matching records moved between files')
+    key_index = cdb.KeyIndex(f"{report_dir}/{KEY_INDEX_FILE_NAME}", RESULT_DB_BUFFER_ROWS)
+    try:
+        moved = match_key_index_records(key_index, f_name, field_names)
+    finally:
+        key_index.close()
+        os_remove(f"{report_dir}/{KEY_INDEX_FILE_NAME}")
+    timestamp_output(f">>> {moved} records moved between files are matched")
+
+
+def match_key_index_records(key_index, f_name: str, field_names: list) -> int:
+    """index unmatched records by key, compare lost and extra records of the same key,
+       see match_moved_records
+    Args:
+        key_index (KeyIndex): empty key index
+        f_name (string): unmatched records filename
+        field_names (list): a list of record field names
+    Returns:
+        int: number of moved records"""
+    global result_pair_id
+    with open(f_name, 'r', encoding='utf-8') as f:
+        for i in f:
+            side, pair, line = json.loads(i)
+            key_index.add(cf.key_composer(line_to_record(line), settings_dict['diff_keys']),
+                          side, pair, line)
+
+    moved = 0
+    for _, records in key_index.groups():
+        losts = [x for x in records if x[0] == 'lost']
+        extras = [x for x in records if x[0] == 'extra']
+        # n-th lost record of key is matched with n-th extra record of key
+        for (_, etl_pair, etl_line), (_, src_pair, src_line) in zip(losts, extras):
+            moved += 1
+            stats_list[4] += 1 # to matched out
+            stats_list[5] -= 1 # from losts out
+            stats_list[6] -= 1 # from extras out
+            stats_list[13] = f"{etl_pair} -> {src_pair}"
+            if result_store is not None:
+                result_pair_id = result_store.get_pair_id(etl_pair)
+            recs = [line_to_record(etl_line), line_to_record(src_line)]
+            report_writer.write(f"{report_dir}/!_moved.rep", f"{stats_list[13]}:\n{recs[0]}\n\n")
+            write_compare_result(compare_records(recs[0], recs[1]), recs, field_names)
+        # the rest are written as usual reports
+        for side, pair, line in losts[len(extras):] + extras[len(losts):]:
+            stats_list[13] = pair
+            if result_store is not None:
+                result_pair_id = result_store.get_pair_id(pair)
+            write_unmatched_record(side, line, True)
+    return moved
+
+
+def get_result_key(rec: list) -> str:
+    """returns record key for results database
+    Args:
+        rec (list): record fields list
+    Returns:
+        string: key column value, see compare_db.get_key"""
+    return cdb.get_key([rec[x] for x in settings_dict['diff_keys'] if x < len(rec)])
+
+
+def write_compare_result(res: list, recs: list, field_names: list) -> None:
+    """count broken record, write field error and defective reports of compared records
+    Args:
+        res (list): [res, defective] result of compare_records
+        recs (list): [etl_rec, src_rec] compared records
+        field_names (list): a list of record field names
+    Returns:
+        None: performs buffered reports write"""
+    if res[0]:
+        stats_list[17] += 1 # add total broken record
+        stats_list_curr_file[17] += 1 # add current broken record
+
+        # broken record is written once with all broken fields
+        if settings_dict['broken_records_output'] != 'fields':
+            report_writer.write(f"{report_dir}/{BROKEN_RECORDS_FILE_NAME}", json.dumps(
+                {'pair': stats_list[13],
+                 'key': [recs[0][x] for x in settings_dict['diff_keys']],
+                 'fields': list(res[0]),
+                 'old': recs[0],
+                 'new': recs[1]}, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    # write error reports
+    if settings_dict['broken_records_output'] != 'jsonl':
+        for k, v in res[0].items():
+            report_writer.write(f"{report_dir}/{str(k).zfill(3)}_{field_names[k]}.rep", v)
+
+    # write defective reports
+    for j in res[1]:
+        report_writer.write(f"{report_dir}/!!!_defective.rep", j)
+    if res[1] and result_store is not None:
+        for system, rec in (('old', recs[0]), ('new', recs[1])):
+            if len(rec) != settings_dict['number_of_fields']:
+                result_store.add('defective', result_pair_id, [system, cdb.get_record(rec)])
+
+
+def get_auto_memory_budget() -> int:
+    """returns memory budget of one pair, half of physical memory shared by pool workers
+    Args:
+        None
+    Returns:
+        int: memory budget, MB, 0 - physical memory size is unknown, pairs are not spilled"""
+    if os_sysconf is None:
+        return 0
+    try:
+        memory = os_sysconf('SC_PAGE_SIZE') * os_sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError):
+        return 0
+    return max(memory // 2 // settings_dict['workers_count'] // 1024 // 1024, 1)
+
+
+def get_pair_memory_estimate(k: str) -> int:
+    """returns estimated memory size of old sys file records store
+    Args:
+        k (string): name of old sys file
+    Returns:
+        int: estimated size, bytes"""
+    size = os_path.getsize(k)
+    if cf.get_file_compression(k):
+        size *= SPILL_COMPRESSION_RATIO
+    return size + raw_lines_count_by_file.get(k, 0) * SPILL_RECORD_OVERHEAD
+
+
+def get_spill_buckets_count(k: str) -> int:
+    """returns number of buckets, so bucket records store fits in memory budget
+    Args:
+        k (string): name of old sys file
+    Returns:
+        int: number of buckets, twice as much as needed for uneven keys distribution"""
+    if not settings_dict['memory_budget']:
+        return 2
+    budget = settings_dict['memory_budget'] * 1024 * 1024
+    return min(max(-(-get_pair_memory_estimate(k) // budget) * 2, 2), SPILL_MAX_BUCKETS)
+
+
+def is_spilled_pair(k: str) -> bool:
+    """check if pair is diffed by buckets spilled to disk
+    Args:
+        k (string): name of old sys file
+    Returns:
+        bool: True - diff_mode = spill or diff_mode = dict and old sys records do not fit
+              in memory_budget"""
+    if settings_dict['diff_mode'] == 'spill':
+        return True
+    return (settings_dict['diff_mode'] == 'dict' and settings_dict['memory_budget'] > 0 and
+            get_pair_memory_estimate(k) > settings_dict['memory_budget'] * 1024 * 1024)
+
+
+def get_dict_pair_records(k: str, v: str):
+    """reads old sys file of pair into records store, matches new sys records by key
+       while reading new sys file, new sys records are not kept in memory
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+    Returns:
+        generator: yields [event, etl_line, src_line]
+            event - string, 'lost', 'extra' or 'matched'
+            etl_line - old sys raw record line, None for extra
+            src_line - new sys raw record line, None for lost"""
+    # get oldsys records, newsys file is read ahead at the same time
+    prefetch_file(v, get_read_encoding(False))
+    stats_list[15] = f"reading {settings_dict['legacy_system_name']} records.."
+    oldsys_records, _, _, file_records_num = get_records_from_file(k, True)
+    stats_list[11] = file_records_num # current file records number
+    stats_list_curr_file[2] = stats_list[11] # oldsys curr file total recs
+
+    # match newsys records
+    stats_list[15] = f"processing diff with {settings_dict['new_system_name']} records.."
+    yield from match_pair_records(oldsys_records, ([key, line] for key, _, line in
+                                                   iter_file_records(v, False, [], [])))
+
+
+def match_pair_records(oldsys_records, newsys_records):
+    """matches new sys records by key with old sys records store, new sys records are
+       not kept in memory
+    Args:
+        oldsys_records (RecordStore): old sys records
+        newsys_records (iterable): [key, line] of each new sys record
+    Returns:
+        generator: yields [event, etl_line, src_line], see get_dict_pair_records"""
+    matched = bytearray(len(oldsys_records)) # matched flag for each oldsys record
+    extra_keys = set()
+    for key, line in newsys_records:
+        n = oldsys_records.index.get(key)
+        if n is None:
+            if key in extra_keys:
+                stats_list[8] += 1 # add to newsys repeats
+                continue
+            extra_keys.add(key)
+            stats_list_curr_file[3] += 1 # newsys curr file total recs
+            yield ['extra', None, line]
+        elif matched[n]:
+            stats_list[8] += 1 # add to newsys repeats
+        else:
+            matched[n] = 1
+            stats_list_curr_file[3] += 1 # newsys curr file total recs
+            yield ['matched', oldsys_records.line(n), line]
+
+    stats_list[15] = 'writing lost reports..'
+    for _, n in oldsys_records.items():
+        if not matched[n]:
+            yield ['lost', oldsys_records.line(n), None]
+
+
+def get_spilled_pair_records(k: str, v: str):
+    """splits records of both pair files into bucket files on disk by key hash, then
+       diffs bucket by bucket, only old sys records of one bucket are kept in memory
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+    Returns:
+        generator: yields [event, etl_line, src_line], see get_dict_pair_records"""
+    buckets = get_spill_buckets_count(k)
+    spill_dir = mkdtemp(prefix='compare_spill_', dir=settings_dict['spill_dir'] or None)
+    timestamp_output(f"(INFO) {stats_list[13]}: pair is diffed by {buckets} buckets "
+                     f"spilled to {spill_dir}")
+    stats_list[11] = get_file_records_num(raw_lines_count_by_file[k])
+    # newsys file is read ahead while oldsys records are spilled
+    prefetch_file(v, get_read_encoding(False))
+    try:
+        spills = []
+        for name, filename, is_from_oldsys in (('old', k, True), ('new', v, False)):
+            stats_list[15] = f"spilling {filename.split('/')[-1]} records to disk.."
+            spill = cstore.SpilledRecords(f"{spill_dir}/{name}", buckets, SPILL_BUFFER_SIZE)
+            for key, _, line in iter_file_records(filename, is_from_oldsys, [], []):
+                spill.add(key, line)
+            spill.close()
+            spills.append(spill)
+
+        for n in range(buckets):
+            stats_list[15] = f"processing diff of bucket {n + 1}/{buckets}.."
+            oldsys_records = cstore.RecordStore(b'' if settings_dict['read_mode'] == 'bytes'
+                                                else '')
+            for key, line in spills[0].bucket(n):
+                if oldsys_records.add(key, line):
+                    stats_list_curr_file[2] += 1 # oldsys curr file total recs
+                else:
+                    stats_list[7] += 1 # add to oldsys repeats
+            yield from match_pair_records(oldsys_records, spills[1].bucket(n))
+    finally:
+        rmtree(spill_dir, ignore_errors=True)
+
+
+def get_merged_pair_records(k: str, v: str):
+    """streaming merge join of pair files, both files must be sorted by diff keys
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+    Returns:
+        generator: yields [event, etl_line, src_line]
+            event - string, 'lost', 'extra' or 'matched'
+            etl_line - old sys raw record line, None for extra
+            src_line - new sys raw record line, None for lost
+    Except:
+        UnsortedRecordsError: records of any pair file are not sorted by diff keys"""
+    stats_list[11] = get_file_records_num(raw_lines_count_by_file[k])
+    stats_list[15] = 'processing sorted records merge diff..'
+    prefetch_file(k, get_read_encoding(True))
+    prefetch_file(v, get_read_encoding(False))
+    etl_iter = iter_sorted_file_records(k, True)
+    src_iter = iter_sorted_file_records(v, False)
+    etl = next(etl_iter, None)
+    src = next(src_iter, None)
+
+    while etl is not None or src is not None:
+        if src is None or (etl is not None and etl[0] < src[0]):
+            yield ['lost', etl[1], None]
+            etl = next(etl_iter, None)
+        elif etl is None or src[0] < etl[0]:
+            yield ['extra', None, src[1]]
+            src = next(src_iter, None)
+        else:
+            yield ['matched', etl[1], src[1]]
+            etl = next(etl_iter, None)
+            src = next(src_iter, None)
+
+
+def init_pool_worker(settings: dict, lines_count: dict, progress, log_queue) -> None:
+    """init diff pool worker process
+    Args:
+        settings (dict): settings_dict of the main process
+        lines_count (dict): raw_lines_count_by_file of the main process
+        progress (Value): shared counter of processed records for all workers
+        log_queue (multiprocessing.Queue): queue of worker log lines
+    Returns:
+        None: performs worker globals init, starts progress sync thread"""
+    global is_pool_worker, logfile
+    is_pool_worker = True
+    # writing thread of main process log is not forked, worker log lines are written to
+    # log file by the main process
+    logfile = clog.QueueLogWriter(log_queue)
+    # Ctrl+C is handled by the main process, it terminates the pool
+    signal(SIGINT, SIG_IGN)
+    settings_dict.update(settings)
+    raw_lines_count_by_file.update(lines_count)
+    init_record_parser()
+    init_compare_plan()
+    cf.init_deep_diff_cache(settings_dict['diff_pattern_cache_size'])
+    Thread(target=progress_sync, args=(progress, ), daemon=True).start()
+
+
+def progress_sync(progress) -> None:
+    """push processed records number of pool worker to shared counter
+    Args:
+        progress (Value): shared counter of processed records for all workers
+    Returns:
+        None: performs shared counter update once a second"""
+    last = 0
+    while True:
+        curr = stats_list[16]
+        if curr != last:
+            with progress.get_lock():
+                progress.value += curr - last
+            last = curr
+        time.sleep(1)
+
+
+def diff_pair_in_worker(n: int, k: str, v: str, field_names: list) -> list:
+    """diff a single pair of files in pool worker, reports go to pair parts dir
+    Args:
+        n (int): pair number, used as parts dir name
+        k (string): name of old sys file
+        v (string): name of new sys file
+        field_names (list): a list of record field names
+    Returns:
+        list: [parts_dir, stats, fields_errors, diff_patterns, cache_stats, metrics, lines]
+            parts_dir - string, dir with pair reports to merge
+            stats - list, stats_list counters of the pair
+            fields_errors - dict, fields_error_dict counters of the pair
+            diff_patterns - dict, diff_pattern_dict counters of the pair
+            cache_stats - list, diff patterns cache counters of the pair
+            metrics - dict, pair metrics, see get_pair_metrics
+            lines - list, real lines count of pair files, see get_pair_lines_count"""
+    global report_dir, report_writer, result_store
+    # reset worker counters, keep stats_list[16] growing for progress_sync
+    for i in MERGED_STATS_INDEXES:
+        stats_list[i] = 0
+    fields_error_dict.clear()
+    diff_pattern_dict.clear()
+
+    report_dir = (f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}/"
+                  f".parts/{str(n).zfill(5)}")
+    os_makedirs(report_dir, exist_ok=True)
+    report_writer = crep.ReportWriter(settings_dict['report_buffer_size'] * 1024 * 1024)
+    if settings_dict['result_db']:
+        result_store = cdb.ResultStore(f"{report_dir}/{RESULT_DB_FILE_NAME}",
+                                       RESULT_DB_BUFFER_ROWS)
+    cache_stats_before = cf.get_deep_diff_cache_stats()
+    try:
+        diff_pair(k, v, field_names)
+    finally:
+        report_writer.close()
+        if result_store is not None:
+            result_store.close(False)
+    cache_stats = [x - y for x, y in zip(cf.get_deep_diff_cache_stats(), cache_stats_before)]
+    logfile.flush()
+    return [report_dir, stats_list, fields_error_dict, diff_pattern_dict, cache_stats,
+            pairs_metrics[-1], get_pair_lines_count(k, v)]
+
+
+def merge_pair_result(res: list) -> None:
+    """merge pool worker pair result into total stats and reports
+    Args:
+        res (list): result of diff_pair_in_worker
+    Returns:
+        None: performs stats merge, appends pair reports to result dir"""
+    parts_dir, pair_stats, pair_fields_errors, pair_patterns, pair_cache_stats = res[:5]
+    pair_metrics = res[5]
+    # real lines count of pair files, worker totals are already corrected with it
+    k, v = pair_metrics['pair']
+    raw_lines_count_by_file[k], raw_lines_count_by_file[v] = res[6]
+
+    merge_counters([[pair_stats[i] for i in MERGED_STATS_INDEXES], pair_fields_errors,
+                    pair_patterns])
+    for n, i in enumerate(pair_cache_stats):
+        pool_deep_diff_cache_stats[n] += i
+    pairs_metrics.append(pair_metrics)
+    for k, v in pair_metrics['phases'].items():
+        total_phase_times[k] += v
+
+    for name in sorted(os_listdir(parts_dir)):
+        if name == RESULT_DB_FILE_NAME:
+            result_store.import_db(f"{parts_dir}/{name}")
+        else:
+            with open(f"{parts_dir}/{name}", 'rb') as part_f:
+                with open(f"{report_dir}/{name}", 'ab') as rep_f:
+                    copyfileobj(part_f, rep_f)
+        os_remove(f"{parts_dir}/{name}")
+    os_rmdir(parts_dir)
+    stats_list[1] += 1 # current file pair number
+
+
+def merge_counters(counters: list) -> None:
+    """add counters of diffed pairs to total stats, field errors and diff patterns
+    Args:
+        counters (list): [stats, fields_errors, diff_patterns]
+            stats - list, stats_list counters in MERGED_STATS_INDEXES order
+            fields_errors - dict, fields_error_dict counters
+            diff_patterns - dict, diff_pattern_dict counters
+    Returns:
+        None: performs totals update"""
+    stats, fields_errors, patterns = counters
+    for i, val in zip(MERGED_STATS_INDEXES, stats):
+        stats_list[i] += val
+    for k, v in fields_errors.items():
+        if k not in fields_error_dict:
+            fields_error_dict[k] = v
+        else:
+            fields_error_dict[k] += v
+    for k, v in patterns.items():
+        if k not in diff_pattern_dict:
+            diff_pattern_dict[k] = dict(v)
+        else:
+            for k1, v1 in v.items():
+                if k1 not in diff_pattern_dict[k]:
+                    diff_pattern_dict[k][k1] = v1
+                else:
+                    diff_pattern_dict[k][k1] += v1
+
+
+def get_pair_lines_count(k: str, v: str) -> list:
+    """returns lines count of pair files, real one once pair is diffed
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+    Returns:
+        list: [old sys file lines, new sys file lines]"""
+    return [raw_lines_count_by_file[k], raw_lines_count_by_file[v]]
+
+
+def merge_saved_pair(entry: dict) -> None:
+    """merge counters of pair done by previous run, taken from checkpoint or pair cache,
+       old and new sys records totals are corrected with saved real lines count of pair
+       files, saved correction depends on lines count estimated by previous run
+    Args:
+        entry (dict): {'pair': [etl, src], 'counters': counters, 'lines': lines}
+            counters - list, see merge_counters
+            lines - list, see get_pair_lines_count, entry of previous version has no lines
+    Returns:
+        None: performs totals update"""
+    stats, fields_errors, patterns = entry['counters']
+    if 'lines' in entry:
+        stats = [0 if i in (2, 3) else x for i, x in zip(MERGED_STATS_INDEXES, stats)]
+        for name, lines_num, i in zip(entry['pair'], entry['lines'], (2, 3)):
+            stats_list[i] += get_file_records_num(lines_num) - get_file_records_num(
+                raw_lines_count_by_file.get(name, lines_num))
+            raw_lines_count_by_file[name] = lines_num
+    merge_counters([stats, {int(k): v for k, v in fields_errors.items()},
+                    {int(k): v for k, v in patterns.items()}])
+
+
+def get_counters() -> list:
+    """returns copy of total counters, see merge_counters
+    Args:
+        None
+    Returns:
+        list: [stats, fields_errors, diff_patterns]"""
+    return [[stats_list[i] for i in MERGED_STATS_INDEXES], dict(fields_error_dict),
+            {k: dict(v) for k, v in diff_pattern_dict.items()}]
+
+
+def get_counters_delta(before: list) -> list:
+    """returns counters grown since get_counters call, i.e. counters of diffed pair
+    Args:
+        before (list): result of get_counters
+    Returns:
+        list: [stats, fields_errors, diff_patterns], see merge_counters"""
+    stats = [stats_list[i] - x for i, x in zip(MERGED_STATS_INDEXES, before[0])]
+    fields_errors = {k: v - before[1].get(k, 0) for k, v in fields_error_dict.items()
+                     if v != before[1].get(k, 0)}
+    patterns = {}
+    for k, v in diff_pattern_dict.items():
+        prev = before[2].get(k, {})
+        delta = {k1: v1 - prev.get(k1, 0) for k1, v1 in v.items() if v1 != prev.get(k1, 0)}
+        if delta:
+            patterns[k] = delta
+    return [stats, fields_errors, patterns]
+
+
+def get_result_files_sizes() -> dict:
+    """returns sizes of result dir files, checkpoint manifest and results database are skipped
+    Args:
+        None
+    Returns:
+        dict: key - filename, value - file size in bytes"""
+    return {x: os_path.getsize(f"{report_dir}/{x}") for x in os_listdir(report_dir)
+            if os_path.isfile(f"{report_dir}/{x}") and x != CHECKPOINT_FILE_NAME and
+            not x.startswith(RESULT_DB_FILE_NAME)}
+
+
+def save_checkpoint(entry: dict) -> None:
+    """append entry to checkpoint manifest, sizes of result dir files are saved with entry
+    Args:
+        entry (dict): manifest entry, one of
+            {'start': True} - new diff is started
+            {'pair': [etl, src], 'counters': counters, 'lines': lines} - pair is done,
+                see merge_saved_pair
+            {'complete': True} - all pairs are done
+    Returns:
+        None: performs manifest file write"""
+    entry['files'] = get_result_files_sizes()
+    cf.write_to_file(f"{report_dir}/{CHECKPOINT_FILE_NAME}", [json.dumps(entry) + '\n'])
+
+
+def load_checkpoint(f_name: str) -> list:
+    """read checkpoint manifest
+    Args:
+        f_name (string): manifest filename
+    Returns:
+        list: a list of manifest entries, see save_checkpoint"""
+    res = []
+    with open(f_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                res.append(json.loads(line))
+            except ValueError:
+                break # manifest write was interrupted, entry is not complete
+    return res
+
+
+def find_resume_diff() -> str:
+    """find the last diff with current diff_name, it is resumed if it is not complete
+    Args:
+        None
+    Returns:
+        string: name of diff to resume, empty if the last diff is complete or absent"""
+    manifests = sorted(glob(f"{settings_dict['diff_out_dir']}/????????_??????_"
+                            f"{settings_dict['diff_name']}/{CHECKPOINT_FILE_NAME}"))
+    if not manifests:
+        return ''
+    entries = load_checkpoint(manifests[-1])
+    if not entries or 'complete' in entries[-1]:
+        return ''
+    return os_path.basename(os_path.dirname(manifests[-1]))
+
+
+def restore_checkpoint() -> set:
+    """take saved counters of done pairs from checkpoint manifest, cut result dir files
+       to their state on the last checkpoint, so reports of interrupted pair are dropped
+    Args:
+        None
+    Returns:
+        set: old sys filenames of done pairs"""
+    entries = load_checkpoint(f"{report_dir}/{CHECKPOINT_FILE_NAME}")
+    done_pairs = set()
+    for i in entries:
+        if 'pair' in i:
+            merge_saved_pair(i)
+            done_pairs.add(i['pair'][0])
+            stats_list[1] += 1 # current file pair number
+    files = entries[-1]['files'] if entries else {}
+
+    rmtree(f"{report_dir}/.parts", ignore_errors=True)
+    for name in os_listdir(report_dir):
+        # results database rows of interrupted pair are deleted by ResultStore.keep_pairs
+        if (name == CHECKPOINT_FILE_NAME or name.endswith('.log') or
+                name.startswith(RESULT_DB_FILE_NAME)):
+            continue
+        if name not in files:
+            os_remove(f"{report_dir}/{name}")
+        elif os_path.getsize(f"{report_dir}/{name}") != files[name]:
+            with open(f"{report_dir}/{name}", 'r+b') as f:
+                f.truncate(files[name])
+    # rewrite manifest without not complete entry
+    with open(f"{report_dir}/{CHECKPOINT_FILE_NAME}", 'w', encoding='utf-8') as f:
+        f.write(''.join([json.dumps(x) + '\n' for x in entries]))
+    return done_pairs
+
+
+def get_pair_cache_dir(k: str, v: str) -> str:
+    """returns pair cache dir, it depends on filenames and settings
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+    Returns:
+        string: cache dir of pair"""
+    cache_dir = cf.get_fingerprint([k, v] + [str(settings_dict[x]) for x in PAIR_CACHE_SETTINGS])
+    return f"{settings_dict['diff_out_dir']}/{PAIR_CACHE_DIR_NAME}/{cache_dir}"
+
+
+def get_pair_identity(k: str, v: str, is_content: bool) -> list:
+    """returns identity of pair files
+    Args:
+        k (string): name of old sys file
+        v (string): name of new sys file
+        is_content (bool): add content fingerprints, files are read fully
+    Returns:
+        list: [size, mtime, content fingerprint] of both pair files, fingerprint is None
+              if is_content is False"""
+    identity = []
+    for i in (k, v):
+        identity += [os_path.getsize(i), os_path.getmtime(i),
+                     cf.get_file_fingerprint(i) if is_content else None]
+    return identity
+
+
+def apply_pair_cache(file_pairs: dict) -> dict:
+    """take results of unchanged pairs from pair cache: reports are appended to result dir,
+       counters are merged into totals
+    Args:
+        file_pairs (dict): a dict of file pairs to diff
+    Returns:
+        dict: a dict of file pairs, which are new or changed and must be diffed"""
+    stats_list[15] = 'checking pairs cache..'
+    res = {}
+    for k, v in file_pairs.items():
+        if thread_break_flag:
+            break
+        cache_dir = get_pair_cache_dir(k, v)
+        identity = get_pair_identity(k, v, False)
+        pair_cache_ids[k] = [cache_dir, v, identity]
+        try:
+            with open(f"{cache_dir}/pair.json", 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        # cache entry without lines count is saved by previous version
+        cached_identity = cached.get('identity') if 'lines' in cached else None
+        # files content is read only if sizes and mtimes of cached pair are not changed
+        if (not cached_identity or cached_identity[0::3] != identity[0::3] or
+                cached_identity[1::3] != identity[1::3]):
+            res[k] = v
+            continue
+        identity = get_pair_identity(k, v, True)
+        pair_cache_ids[k] = [cache_dir, v, identity]
+        if cached_identity != identity:
+            res[k] = v
+            continue
+
+        for name in cached['files']:
+            with open(f"{cache_dir}/{name}", 'rb') as part_f:
+                with open(f"{report_dir}/{name}", 'ab') as rep_f:
+                    copyfileobj(part_f, rep_f)
+        if result_store is not None:
+            result_store.import_db(f"{cache_dir}/{RESULT_DB_FILE_NAME}")
+        merge_saved_pair({'pair': [k, v], 'counters': cached['counters'],
+                          'lines': cached['lines']})
+        stats_list[1] += 1 # current file pair number
+        save_checkpoint({'pair': [k, v], 'counters': cached['counters'],
+                         'lines': cached['lines']})
+    timestamp_output(f"(INFO) pairs cache: {len(file_pairs) - len(res)} pairs are not changed, "
+                     f"{len(res)} pairs to diff")
+    return res
+
+
+def save_pair_cache(k: str, counters: list, files_before: dict) -> None:
+    """save pair counters and reports written by pair to pair cache
+    Args:
+        k (string): name of old sys file
+        counters (list): pair counters, see merge_counters
+        files_before (dict): result dir files sizes before pair, see get_result_files_sizes
+    Returns:
+        None: performs pair cache write"""
+    cache_dir, v, identity = pair_cache_ids[k]
+    if identity[2] is None:
+        # pair was not in cache, files content is read once diff is done
+        identity = identity[:2] + [cf.get_file_fingerprint(k)] + identity[3:5] + \
+            [cf.get_file_fingerprint(v)]
+    rmtree(cache_dir, ignore_errors=True)
+    os_makedirs(cache_dir, exist_ok=True)
+    files = []
+    for name, size in get_result_files_sizes().items():
+        start = files_before.get(name, 0)
+        if size == start:
+            continue
+        with open(f"{report_dir}/{name}", 'rb') as rep_f:
+            rep_f.seek(start)
+            with open(f"{cache_dir}/{name}", 'wb') as part_f:
+                left = size - start
+                while left:
+                    block = rep_f.read(min(left, cf.LINES_COUNT_BLOCK_SIZE))
+                    part_f.write(block)
+                    left -= len(block)
+        files.append(name)
+    if result_store is not None:
+        result_store.export_pair(k, f"{cache_dir}/{RESULT_DB_FILE_NAME}")
+    # pair.json is written last, cache entry without it is not used
+    with open(f"{cache_dir}/pair.json", 'w', encoding='utf-8') as f:
+        json.dump({'identity': identity, 'files': sorted(files), 'counters': counters,
+                   'lines': get_pair_lines_count(k, v)}, f)
+
+
+def diff_in_pool(file_pairs: dict, field_names: list) -> None:
+    """diff file pairs in parallel using workers_count processes
+    Args:
+        file_pairs (dict): a dict of file pairs to diff
+            Key - name of old sys file
+            Value - name of new sys file
+        field_names (list): a list of record field names
+    Returns:
+        None: performs diff of all pairs, merges workers results"""
+    # biggest pairs first, so large file will not finish last
+    pairs = sorted(file_pairs.items(),
+                   key=lambda x: os_path.getsize(x[0]) + os_path.getsize(x[1]), reverse=True)
+    progress = Value('q', 0)
+    done_records = 0
+
+    stats_list[11] = stats_list[2] # all workers records for livestat
+    stats_list[12] = 0
+    stats_list[13] = f"{len(pairs)} pairs in {settings_dict['workers_count']} workers"
+    stats_list[15] = 'processing diff in workers pool..'
+    timestamp_output(f"<<< processing diff in {settings_dict['workers_count']} workers")
+    logfile.flush() # to prevent log buffer duplication in forked workers
+    log_queue = mp_Queue()
+    logfile.start_relay(log_queue)
+
+    pool = Pool(settings_dict['workers_count'], initializer=init_pool_worker,
+                initargs=(settings_dict, raw_lines_count_by_file, progress, log_queue))
+    pending = {pool.apply_async(diff_pair_in_worker, (n, k, v, field_names)): [k, v]
+               for n, (k, v) in enumerate(pairs)}
+    while pending:
+        if thread_break_flag:
+            pool.terminate()
+            break
+        for res in [x for x in pending if x.ready()]:
+            try:
+                pair_res = res.get()
+            except UnsortedRecordsError:
+                pool.terminate()
+                pool.join()
+                logfile.stop_relay()
+                rmtree(f"{report_dir}/.parts", ignore_errors=True)
+                raise
+            done_records += pair_res[1][12]
+            files_before = get_result_files_sizes()
+            merge_pair_result(pair_res)
+            pair = pending.pop(res)
+            counters = [[pair_res[1][i] for i in MERGED_STATS_INDEXES], pair_res[2], pair_res[3]]
+            save_checkpoint({'pair': pair, 'counters': counters,
+                             'lines': get_pair_lines_count(pair[0], pair[1])})
+            if settings_dict['pair_cache']:
+                save_pair_cache(pair[0], counters, files_before)
+        stats_list[12] = max(progress.value, done_records)
+        stats_list[16] = stats_list[12]
+        time.sleep(0.5)
+    else:
+        pool.close()
+    pool.join()
+    logfile.stop_relay()
+    rmtree(f"{report_dir}/.parts", ignore_errors=True)
+    timestamp_output('>>> processing diff in workers pool done')
 
 
 def compare_records(etl_rec: list, src_rec: list) -> list:
@@ -954,18 +2647,14 @@ def compare_records(etl_rec: list, src_rec: list) -> list:
                 key - field number
                 value - an f-string, error info strings for report files to write
             defective (list): a list of defective records"""
-    matched = 0
     broken = 0
     res = {}
     defective = []
 
-    if (len(etl_rec) == settings_dict['number_of_fields'] and
-        len(src_rec) == settings_dict['number_of_fields']):
-        for i in range(settings_dict['number_of_fields']):
-            if str(i) in settings_dict['excluded_fields']:
-                continue
-            # if fields are not matched
-            if etl_rec[i] != src_rec[i]:
+    if len(etl_rec) == compare_fields_count and len(src_rec) == compare_fields_count:
+        for i, equal in compare_plan:
+            # if fields are not matched, comparator is called for not the same values only
+            if etl_rec[i] != src_rec[i] and (equal is None or not equal(etl_rec[i], src_rec[i])):
                 stats_list[9] += 1 # add broken stat
                 stats_list_curr_file[9] += 1 # add current broken stat
                 broken += 1
@@ -974,52 +2663,115 @@ def compare_records(etl_rec: list, src_rec: list) -> list:
                 else:
                     fields_error_dict[i] += 1
 
-                diff_pattern = cf.deep_diff(etl_rec[i], src_rec[i])
-                if i not in diff_pattern_dict:
-                    diff_pattern_dict[i] = {}
-                    diff_pattern_dict[i][diff_pattern] = 1
-                else:
-                    if diff_pattern not in diff_pattern_dict[i]:
-                        diff_pattern_dict[i][diff_pattern] = 1
-                    else:
-                        diff_pattern_dict[i][diff_pattern] += 1
-
-                report_str = (
-                f"{stats_list[13]} :: [{etl_rec[i]}]:[{src_rec[i]}] :: "
-                f"({diff_pattern})\n"
-                f"{settings_dict['legacy_system_name']:10}: {etl_rec}\n"
-                f"{settings_dict['new_system_name']:10}: {src_rec}\n\n")
-                res[i] = report_str
-            else:
-                matched += 1
+                res[i] = get_field_report(i, etl_rec, src_rec)
 
         if broken == 0:
             stats_list[10] += 1 # add identical
             stats_list_curr_file[10] += 1 # add identical curr file stats
 
     else:
+        msgs = []
         if len(etl_rec) != settings_dict['number_of_fields']:
-            timestamp_output('(ERROR) Legacy records has incorrect number of fields:')
-            timestamp_output(f"Legacy record: {len(etl_rec)}, "
-                             f"expected: {settings_dict['number_of_fields']}")
-            timestamp_output(f"filename: {stats_list[13].split('/', maxsplit=1)[0]}")
-            timestamp_output(f"defective record: {etl_rec}")
+            msgs += ['(ERROR) Legacy records has incorrect number of fields:',
+                     f"Legacy record: {len(etl_rec)}, "
+                     f"expected: {settings_dict['number_of_fields']}",
+                     f"filename: {stats_list[13].split('/', maxsplit=1)[0]}",
+                     f"defective record: {etl_rec}"]
             report_str = f"{stats_list[13].split('/', maxsplit=1)[0]}\n{etl_rec}\n"
             defective.append(report_str)
 
         if len(src_rec) != settings_dict['number_of_fields']:
-            timestamp_output('(ERROR) NewSys records has incorrect number of fields:')
-            timestamp_output(f"NewSys record: {len(src_rec)}, "
-                             f"expected: {settings_dict['number_of_fields']}")
-            timestamp_output(f"filename: {stats_list[13].split('/')[-1]}")
-            timestamp_output(f"defective record: {src_rec}")
+            msgs += ['(ERROR) NewSys records has incorrect number of fields:',
+                     f"NewSys record: {len(src_rec)}, "
+                     f"expected: {settings_dict['number_of_fields']}",
+                     f"filename: {stats_list[13].split('/')[-1]}",
+                     f"defective record: {src_rec}"]
             report_str = f"{stats_list[13].split('/', maxsplit=1)[-1]}\n{src_rec}\n"
             defective.append(report_str)
+        defective_output(msgs)
         stats_list[14] += 1 # add defective to total
         stats_list_curr_file[14] += 1 # add defective to curr file stats
     return [res, defective]
 
 
+def get_field_report(i: int, etl_rec: list, src_rec: list) -> str:
+    """count diff pattern of mismatched field, make report string
+    Args:
+        i (int): mismatched field number
+        etl_rec (list): an old sys records list
+        src_rec (list): a new sys records list
+    Returns:
+        string: error info string for field report file, empty if field reports are off"""
+    start = time.perf_counter()
+    diff_pattern = cf.cached_deep_diff(etl_rec[i], src_rec[i])
+    phase_times['pattern_diff'] += time.perf_counter() - start
+    if i not in diff_pattern_dict:
+        diff_pattern_dict[i] = {}
+        diff_pattern_dict[i][diff_pattern] = 1
+    else:
+        if diff_pattern not in diff_pattern_dict[i]:
+            diff_pattern_dict[i][diff_pattern] = 1
+        else:
+            diff_pattern_dict[i][diff_pattern] += 1
+
+    if result_store is not None:
+        result_store.add('broken', result_pair_id, [get_result_key(etl_rec), i, etl_rec[i],
+                                                    src_rec[i], diff_pattern])
+    if settings_dict['broken_records_output'] == 'jsonl':
+        return ''
+
+    return (f"{stats_list[13]} :: [{etl_rec[i]}]:[{src_rec[i]}] :: "
+            f"({diff_pattern})\n"
+            f"{settings_dict['legacy_system_name']:10}: {etl_rec}\n"
+            f"{settings_dict['new_system_name']:10}: {src_rec}\n\n")
+
+
+def compare_records_batch(batch: list) -> list:
+    """compare batch of matched records column-wise using numpy engine, mismatched values
+       only go to diff patterns and reports, stats are the same as compare_records gives
+    Args:
+        batch (list): a list of [etl_rec, src_rec] records pairs
+    Returns:
+        list: a list of [res, defective] for each records pair, see compare_records"""
+    results = [[{}, []] for _ in batch]
+    valid = []
+    for n, (etl_rec, src_rec) in enumerate(batch):
+        if len(etl_rec) == compare_fields_count and len(src_rec) == compare_fields_count:
+            valid.append(n)
+        else:
+            results[n] = compare_records(etl_rec, src_rec) # defective records
+    if not valid:
+        return results
+
+    fields = [i for i, _ in compare_plan]
+    counts, cells = cvec.get_mismatches([batch[n][0] for n in valid],
+                                        [batch[n][1] for n in valid], fields)
+    comparators = {i: equal for i, equal in compare_plan if equal is not None}
+    if comparators:
+        # values which are not the same, but equal by field comparator, are not broken
+        cells = [[row, i] for row, i in cells if i not in comparators or
+                 not comparators[i](*(x[i] for x in batch[valid[row]]))]
+        mismatches = Counter(i for _, i in cells)
+        counts = [mismatches[i] for i in fields]
+    for i, cnt in zip(fields, counts):
+        if cnt:
+            stats_list[9] += cnt # add broken stat
+            stats_list_curr_file[9] += cnt # add current broken stat
+            if i not in fields_error_dict:
+                fields_error_dict[i] = cnt
+            else:
+                fields_error_dict[i] += cnt
+
+    for row, i in cells:
+        etl_rec, src_rec = batch[valid[row]]
+        results[valid[row]][0][i] = get_field_report(i, etl_rec, src_rec)
+
+    identical = len(valid) - len({row for row, _ in cells})
+    stats_list[10] += identical # add identical
+    stats_list_curr_file[10] += identical # add identical curr file stats
+    return results
+
+
 def main_f():
     """main func
     Args:
@@ -1028,6 +2780,7 @@ def main_f():
         None"""
 
     ## starting
+    init_log()
     timestamp_output('>>> starting script')
 
     timestamp_output('<<< reading settings')
@@ -1041,17 +2794,25 @@ def main_f():
     init_settings()
     timestamp_output('>>> reading settings done')
 
-    # update diff name tag, add time_prefix
-    settings_dict['diff_name'] = f"{diff_tag_prefix}_{settings_dict['diff_name']}"
+    # update diff name tag, add time_prefix, or take name of interrupted diff to resume
+    resume_name = find_resume_diff() if settings_dict['resume'] else ''
+    if resume_name:
+        settings_dict['diff_name'] = resume_name
+        timestamp_output(f"(INFO) diff {resume_name} is not complete, it will be resumed")
+    else:
+        settings_dict['diff_name'] = f"{diff_tag_prefix}_{settings_dict['diff_name']}"
 
     # create result dir
-    os_makedirs(f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}", exist_ok=True)
+    global report_dir
+    report_dir = f"{settings_dict['diff_out_dir']}/{settings_dict['diff_name']}"
+    os_makedirs(report_dir, exist_ok=True)
 
     # split field names string for lifestat field err report
     settings_dict['record_field_names'] = settings_dict['record_field_names'].replace(' ', '')
     field_names_list = settings_dict['record_field_names'].split(',')
 
     # check and init files
+    phase_start = time.perf_counter()
     timestamp_output('<<< listing files')
     etalon_files = get_file_list(settings_dict['etalons'], settings_dict['files_mask_etalon'])
     source_files = get_file_list(settings_dict['sources'], settings_dict['files_mask_source'])
@@ -1061,27 +2822,22 @@ def main_f():
     timestamp_output('<<< getting file pairs')
     pairs = get_file_pairs(etalon_files, source_files)
     timestamp_output('>>> getting file pairs done')
+    total_phase_times['listing'] = time.perf_counter() - phase_start
 
     # count total lines, lines for each file
     timestamp_output(f"<<< counting {settings_dict['legacy_system_name']} and "
-                     f"{settings_dict['new_system_name']} record lines")
+                     f"{settings_dict['new_system_name']} record lines "
+                     f"(lines_count_mode = {settings_dict['lines_count_mode']})")
+    global legacy_total_lines
+    global newsys_total_lines
+    phase_start = time.perf_counter()
     for k, v in pairs[0].items():
-        global legacy_total_lines
-        global newsys_total_lines
-        with open(k, 'r', encoding=settings_dict['encode_etl']) as leg_f:
-            n = 0
-            for n, _ in enumerate(leg_f):
-                pass
-            legacy_total_lines += (n + 1) - (settings_dict['header_records_number'] +
-                                             settings_dict['trailer_records_number'])
-            raw_lines_count_by_file[k] = n + 1
-        with open(v, 'r', encoding=settings_dict['encode_src']) as new_f:
-            for n, _ in enumerate(new_f):
-                pass
-            newsys_total_lines += (1 + n) - (settings_dict['header_records_number'] +
-                                             settings_dict['trailer_records_number'])
-            raw_lines_count_by_file[v] = n + 1
+        raw_lines_count_by_file[k] = get_file_lines_count(k, settings_dict['encode_etl'])
+        legacy_total_lines += get_file_records_num(raw_lines_count_by_file[k])
+        raw_lines_count_by_file[v] = get_file_lines_count(v, settings_dict['encode_src'])
+        newsys_total_lines += get_file_records_num(raw_lines_count_by_file[v])
 
+    total_phase_times['lines_count'] = time.perf_counter() - phase_start
     timestamp_output(f">>> legacy_record_lines: {legacy_total_lines}, "
                      f"newsys_record_lines: {newsys_total_lines}")
 
@@ -1091,70 +2847,61 @@ def main_f():
 
     # get best diff keys or use previously found
     timestamp_output('<<< checking diff keys')
+    phase_start = time.perf_counter()
     if settings_dict['diff_keys_type'] == 'auto':
-        if (settings_dict['auto_keys_search_each_run'] or
-        not os_path.exists(f"{SCRIPT_PATH}auto_generated_keys.ini")):
+        found_keys = {}
+        schema = get_keys_schema_fingerprint()
+        if os_path.exists(KEYS_FILE_NAME):
+            found_keys = load_found_keys(KEYS_FILE_NAME)
+            if found_keys and found_keys['schema'] != schema:
+                timestamp_output('(INFO) records layout is changed since diff keys were found, '
+                                 'keys will be searched again')
+                found_keys = {}
+
+        if found_keys and not settings_dict['auto_keys_search_each_run']:
+            timestamp_output('<<< applying previously found diff keys '
+                                'from auto_generated_keys.ini')
+            timestamp_output('(INFO) remove auto_generated_keys.ini file '
+                                'if you need another auto diff keys detection!'
+                                'Or use auto_keys_search_each_run')
+            settings_dict['diff_keys'] = found_keys['keys']
+            timestamp_output(f">>> current diff keys: {settings_dict['diff_keys']}")
+        else:
             timestamp_output(">>> diff keys aren't defined yet or auto_keys_search_each_run = True")
-            timestamp_output(f"<<< browsing {settings_dict['diff_keys_search_count']}"
-                                ' lines from etalon samples..')   
-            test_records_list = []
-            break_flag = False
-
-            for file in etalon_files:
-                for line in get_records_from_file(file, True)[0].values():
-                    # defective records cutoff
-                    if len(line) != settings_dict['number_of_fields']:
-                        print('defective')
-                        continue
-                    #records count limiter
-                    if len(test_records_list) == settings_dict['diff_keys_search_count']:
-                        break_flag = True
-                        break
-                    else:
-                        test_records_list.append(line)
-                if break_flag:
-                    break
+            timestamp_output(f"<<< sampling {settings_dict['diff_keys_search_count']}"
+                                ' lines from etalon samples..')
+            test_records_list = sample_etalon_records(etalon_files,
+                                                      settings_dict['diff_keys_search_count'],
+                                                      settings_dict['diff_keys_scan_lines'])
             timestamp_output(f">>> got {len(test_records_list)} lines from etalon samples")
-            timestamp_output('<<< determine best diff keys..')
 
             if len(test_records_list) < 10:
                 timestamp_output('(ERROR) to few etalon records for auto keys find. '
                                 'use manual keys or add etalons, stopping script')
                 sys_exit()
-            diff_keys = get_diff_keys(test_records_list)
-            if diff_keys:
-                settings_dict['diff_keys'] = diff_keys
-                timestamp_output(f">>> found diff keys: {diff_keys}")
-                timestamp_output('<<< saving new keys in auto_generated_keys.ini')
-                save_found_keys(SCRIPT_PATH + '/auto_generated_keys.ini',
-                                settings_dict['diff_keys'])
-                timestamp_output('>>> saving new keys done')
-            else:
-                timestamp_output('(ERROR) auto diff keys search failed, stopping script')
-                sys_exit()
-        #elif (not settings_dict['auto_keys_search_each_run']
-        #    and os_path.exists(f"{SCRIPT_PATH}auto_generated_keys.ini")):
-        else:
-            timestamp_output('<<< applying previously found diff keys '
-                                'from auto_generated_keys.ini')
 
-            timestamp_output('(INFO) remove auto_generated_keys.ini file '
-                                'if you need another auto diff keys detection!'
-                                'Or use auto_keys_search_each_run')
-            try:
-                config_keys.read(f"{SCRIPT_PATH}auto_generated_keys.ini")
-                settings_dict['diff_keys'] = config_keys.get('auto_generated_keys', 'keys')
-                timestamp_output(f">>> current diff keys: {list(settings_dict['diff_keys'])}")
-            except configparser.MissingSectionHeaderError:
-                timestamp_output("(ERROR) cant get keys from auto_generated_keys.ini,"
-                                " stopping script")
-                sys_exit()
-            except configparser.NoSectionError:
-                timestamp_output("(ERROR) section 'auto_generated_keys' is not found in "
-                                "auto_generated_keys.ini, stopping script")
-                sys_exit()
+            sample = cf.get_fingerprint([settings_dict['delimiter'].join(x)
+                                         for x in test_records_list])
+            if found_keys and found_keys['sample'] == sample:
+                settings_dict['diff_keys'] = found_keys['keys']
+                timestamp_output(f">>> etalon sample is not changed, using previously found "
+                                 f"diff keys: {settings_dict['diff_keys']}")
+            else:
+                timestamp_output('<<< determine best diff keys..')
+                diff_keys = get_diff_keys(test_records_list)
+                if diff_keys:
+                    settings_dict['diff_keys'] = diff_keys
+                    timestamp_output(f">>> found diff keys: {diff_keys}")
+                    timestamp_output('<<< saving new keys in auto_generated_keys.ini')
+                    save_found_keys(KEYS_FILE_NAME, settings_dict['diff_keys'], schema, sample)
+                    timestamp_output('>>> saving new keys done')
+                else:
+                    timestamp_output('(ERROR) auto diff keys search failed, stopping script')
+                    sys_exit()
     else:
+        settings_dict['diff_keys'] = cf.keys_from_str(settings_dict['diff_keys'])
         timestamp_output(f">>> diff keys are manually set to: {settings_dict['diff_keys']}")
+    total_phase_times['keys_discovery'] = time.perf_counter() - phase_start
 
     # compare file pairs and generate field reports
     timestamp_output('>>> starting diff..')
@@ -1162,9 +2909,10 @@ def main_f():
     th1 = Thread(target=stat_out, args=(stats_list, start_time, field_names_list))
     th2 = Thread(target=diff, args=(pairs[0], field_names_list, ))
 
-    # add REPORT_HEADER (colum names) to main report
-    cf.write_to_file(f"{settings_dict['diff_out_dir']}"
-                  f"/{settings_dict['diff_name']}/diff_result.txt", [REPORT_HEADER])
+    # add REPORT_HEADER (colum names) to main report, resumed diff already has it
+    if not resume_name:
+        cf.write_to_file(f"{settings_dict['diff_out_dir']}"
+                      f"/{settings_dict['diff_name']}/diff_result.txt", [REPORT_HEADER])
 
     # starting diff processing thread
 
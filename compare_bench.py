@@ -0,0 +1,240 @@
+"""benchmark suite for compare script, results are saved as json"""
+import argparse
+import atexit
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+from os import path as os_path, remove as os_remove
+from shutil import rmtree
+from tempfile import mkdtemp
+import compare_alex_ver as cav
+import compare_functions as cf
+import compare_generator as cgen
+import compare_vector as cvec
+
+
+def measure(name: str, func, records: int, data_bytes: int, memory: bool) -> dict:
+    """runs benchmark function, measures time and peak memory
+    Args:
+        name (string): benchmark name
+        func (function): function to run, no args
+        records (int): number of records processed by one func run
+        data_bytes (int): number of bytes processed by one func run
+        memory (bool): additional func run to trace peak memory
+    Returns:
+        dict: benchmark result"""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        tracemalloc.stop()
+
+    res = {
+        'name': name,
+        'seconds': round(elapsed, 4),
+        'records': records,
+        'records_per_sec': round(records / elapsed, 1) if elapsed else None,
+        'mb_per_sec': round(data_bytes / 1024 / 1024 / elapsed, 2) if elapsed else None,
+        'peak_memory_mb': peak
+    }
+    print(f"{name:<24} {res['seconds']:>10} s {res['records_per_sec']:>14} rec/s "
+          f"{res['mb_per_sec']:>10} MB/s {str(peak):>10} MB")
+    return res
+
+
+def init_compare_settings(work_dir: str, args) -> None:
+    """applies generated CDR layout to compare script settings
+    Args:
+        work_dir (string): benchmark work dir
+        args (Namespace): command line arguments
+    Returns:
+        None: performs settings_dict init"""
+    cav.settings_dict.update(cgen.get_cdr_settings(args.fields, args.layout, args.field_size))
+    cav.settings_dict['diff_out_dir'] = f"{work_dir}/res/"
+    cav.settings_dict['diff_mode'] = args.diff_mode
+    cav.settings_dict['read_mode'] = args.read_mode
+    cav.settings_dict['file_reader'] = args.file_reader
+    cav.init_record_parser()
+    cav.init_compare_plan()
+    cf.init_deep_diff_cache(cav.settings_dict['diff_pattern_cache_size'])
+
+
+def run_benchmarks(work_dir: str, args) -> list:
+    """generates CDR pair and runs all benchmarks
+    Args:
+        work_dir (string): benchmark work dir
+        args (Namespace): command line arguments
+    Returns:
+        list: a list of benchmark results"""
+    rates = {'mismatch': args.mismatch_rate, 'lost': args.lost_rate,
+             'extra': args.extra_rate, 'repeat': args.repeat_rate}
+    pairs = cgen.generate_pairs(work_dir, args.pairs, args.records, args.fields, args.layout,
+                                args.field_size, rates, args.seed)
+    init_compare_settings(work_dir, args)
+    for k, v in pairs.items():
+        cav.raw_lines_count_by_file[k] = cf.count_file_lines(k, 'utf-8')
+        cav.raw_lines_count_by_file[v] = cf.count_file_lines(v, 'utf-8')
+    old_name, new_name = next(iter(pairs.items()))
+    old_size = os_path.getsize(old_name)
+    pairs_size = sum(os_path.getsize(k) + os_path.getsize(v) for k, v in pairs.items())
+    pairs_records = sum(cav.raw_lines_count_by_file[k] for k in pairs)
+    pairs_records += sum(cav.raw_lines_count_by_file[v] for v in pairs.values())
+
+    with open(old_name, 'r', encoding='utf-8') as f:
+        old_lines = f.readlines()
+    with open(new_name, 'r', encoding='utf-8') as f:
+        new_lines = f.readlines()
+    old_records = [cav.line_to_record(x) for x in old_lines]
+    new_records_by_key = {}
+    for i in new_lines:
+        rec = cav.line_to_record(i)
+        new_records_by_key[rec[0]] = rec
+    matched = [[x, new_records_by_key[x[0]]] for x in old_records if x[0] in new_records_by_key]
+    mismatched_values = []
+    for etl_rec, src_rec in matched:
+        for etl_val, src_val in zip(etl_rec, src_rec):
+            if etl_val != src_val:
+                mismatched_values.append([etl_val, src_val])
+    keys_sample = old_records[:cav.settings_dict['diff_keys_search_count']]
+    keys = cav.settings_dict['diff_keys']
+
+    def bench_line_to_record():
+        for i in old_lines:
+            cav.line_to_record(i)
+
+    def bench_get_records_from_file():
+        cav.get_records_from_file(old_name, True)
+
+    def bench_key_composer():
+        for i in old_records:
+            cf.key_composer(i, keys)
+
+    def bench_compare_records():
+        for etl_rec, src_rec in matched:
+            cav.compare_records(etl_rec, src_rec)
+
+    def bench_compare_records_batch():
+        for i in range(0, len(matched), cav.COMPARE_BATCH_SIZE):
+            cav.compare_records_batch(matched[i:i + cav.COMPARE_BATCH_SIZE])
+
+    def bench_deep_diff():
+        for etl_val, src_val in mismatched_values:
+            cf.deep_diff(etl_val, src_val)
+
+    def bench_get_diff_keys():
+        cav.get_diff_keys(keys_sample)
+
+    runs = [0]
+
+    def bench_diff():
+        # each run writes reports to a fresh result dir
+        runs[0] += 1
+        cav.settings_dict['diff_name'] = f"bench_{runs[0]}"
+        cav.report_dir = f"{cav.settings_dict['diff_out_dir']}/{cav.settings_dict['diff_name']}"
+        cav.os_makedirs(cav.report_dir, exist_ok=True)
+        for n, i in enumerate(cav.stats_list):
+            cav.stats_list[n] = 0 if isinstance(i, int) else ''
+        cav.fields_error_dict.clear()
+        cav.diff_pattern_dict.clear()
+        cav.pairs_metrics.clear()
+        cav.stats_list[2] = sum(cav.raw_lines_count_by_file[k] for k in pairs)
+        cav.stats_list[3] = sum(cav.raw_lines_count_by_file[v] for v in pairs.values())
+        cav.diff(pairs, cav.settings_dict['record_field_names'].split(','))
+
+    print(f"{'benchmark':<24} {'time':>12} {'records':>20} {'throughput':>15} {'peak':>13}")
+    results = [
+        measure('line_to_record', bench_line_to_record, len(old_lines), old_size, args.memory),
+        measure('get_records_from_file', bench_get_records_from_file, len(old_lines), old_size,
+                args.memory),
+        measure('key_composer', bench_key_composer, len(old_records), old_size, args.memory),
+        measure('compare_records', bench_compare_records, len(matched), old_size, args.memory),
+        measure('deep_diff', bench_deep_diff, len(mismatched_values), 0, args.memory),
+        measure('get_diff_keys', bench_get_diff_keys, len(keys_sample), 0, args.memory),
+        measure('diff', bench_diff, pairs_records, pairs_size, args.memory)
+    ]
+    if cvec.is_available():
+        results.append(measure('compare_records_batch', bench_compare_records_batch,
+                               len(matched), old_size, args.memory))
+    return results
+
+
+def compare_results(results: list, prev_name: str) -> None:
+    """prints speedup of results against previously saved benchmark run
+    Args:
+        results (list): a list of benchmark results
+        prev_name (string): previous benchmark json filename
+    Returns:
+        None: performs console print"""
+    with open(prev_name, 'r', encoding='utf-8') as f:
+        prev = {x['name']: x for x in json.load(f)['results']}
+    print(f"\ncompared with {prev_name}:")
+    for i in results:
+        if i['name'] in prev and prev[i['name']]['seconds']:
+            print(f"{i['name']:<24} x{prev[i['name']]['seconds'] / i['seconds']:.2f}")
+
+
+def remove_log() -> None:
+    """close and remove log files of compare script, see main
+    Args:
+        None
+    Returns:
+        None"""
+    log_files = cav.logfile.get_file_names()
+    cav.logfile.close()
+    for i in log_files:
+        if os_path.exists(i):
+            os_remove(i)
+
+
+def main() -> None:
+    """benchmark command line entry point"""
+    # compare script log is opened here and removed on any exit, including --help and
+    # arguments errors
+    cav.init_log()
+    atexit.register(remove_log)
+    parser = argparse.ArgumentParser(description='compare script benchmark suite')
+    parser.add_argument('--pairs', type=int, default=2)
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--fields', type=int, default=20)
+    parser.add_argument('--layout', choices=['char', 'fixed'], default='char')
+    parser.add_argument('--field-size', type=int, default=10)
+    parser.add_argument('--mismatch-rate', type=float, default=0.05)
+    parser.add_argument('--lost-rate', type=float, default=0.01)
+    parser.add_argument('--extra-rate', type=float, default=0.01)
+    parser.add_argument('--repeat-rate', type=float, default=0.001)
+    parser.add_argument('--diff-mode', choices=['dict', 'merge', 'spill'], default='dict')
+    parser.add_argument('--read-mode', choices=['text', 'bytes'], default='text')
+    parser.add_argument('--file-reader', choices=['stream', 'mmap'], default='stream')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip peak memory runs')
+    parser.add_argument('--out', default=f"bench_{datetime.now():%Y%m%d_%H%M%S}.json",
+                        help='results json filename')
+    parser.add_argument('--compare', help='previous results json to compare with')
+    args = parser.parse_args()
+
+    work_dir = mkdtemp(prefix='compare_bench_')
+    try:
+        results = run_benchmarks(work_dir, args)
+    finally:
+        rmtree(work_dir, ignore_errors=True)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(),
+                   'params': vars(args),
+                   'results': results}, f, indent=2)
+    print(f"\nresults saved to {args.out}")
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""sqlite diff results store module for compare script, also results query entry point"""
+import argparse
+import json
+import sqlite3
+from itertools import groupby
+from operator import itemgetter
+
+PAIR_STATS_COLUMNS = ('old_records', 'new_records', 'matched', 'losts', 'extras', 'old_repeats',
+                      'new_repeats', 'broken_records', 'broken_fields', 'defective', 'identical')
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS pairs (pair_id INTEGER PRIMARY KEY, pair TEXT, old_file TEXT, '
+    f"new_file TEXT, {', '.join([f'{x} INTEGER' for x in PAIR_STATS_COLUMNS])})",
+    'CREATE TABLE IF NOT EXISTS losts (pair_id INTEGER, key TEXT, record TEXT)',
+    'CREATE TABLE IF NOT EXISTS extras (pair_id INTEGER, key TEXT, record TEXT)',
+    'CREATE TABLE IF NOT EXISTS broken (pair_id INTEGER, key TEXT, field INTEGER, '
+    'old_value TEXT, new_value TEXT, pattern TEXT)',
+    'CREATE TABLE IF NOT EXISTS defective (pair_id INTEGER, system TEXT, record TEXT)',
+    'CREATE TABLE IF NOT EXISTS fields (field INTEGER PRIMARY KEY, name TEXT)')
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS broken_field ON broken (field)',
+    'CREATE INDEX IF NOT EXISTS broken_pair ON broken (pair_id)',
+    'CREATE INDEX IF NOT EXISTS broken_key ON broken (key)',
+    'CREATE INDEX IF NOT EXISTS losts_pair ON losts (pair_id)',
+    'CREATE INDEX IF NOT EXISTS losts_key ON losts (key)',
+    'CREATE INDEX IF NOT EXISTS extras_pair ON extras (pair_id)',
+    'CREATE INDEX IF NOT EXISTS extras_key ON extras (key)',
+    'CREATE INDEX IF NOT EXISTS defective_pair ON defective (pair_id)')
+# columns of record tables, pair_id goes first
+TABLE_COLUMNS = {
+    'losts': ('key', 'record'),
+    'extras': ('key', 'record'),
+    'broken': ('key', 'field', 'old_value', 'new_value', 'pattern'),
+    'defective': ('system', 'record')
+}
+
+
+class ResultStore:
+    """writes diff results into sqlite database, rows are collected in memory and
+       inserted in one transaction when buffer limit is reached"""
+
+    def __init__(self, f_name: str, buffer_rows: int) -> None:
+        """open or create results database
+        Args:
+            f_name (string): database filename
+            buffer_rows (int): rows buffer limit
+        Returns:
+            None"""
+        self.buffer_rows = buffer_rows
+        self.buffered = 0
+        self.buffers = {x: [] for x in TABLE_COLUMNS}
+        self.conn = sqlite3.connect(f_name)
+        with self.conn:
+            for i in SCHEMA:
+                self.conn.execute(i)
+
+    def set_fields(self, field_names: list) -> None:
+        """save record field names
+        Args:
+            field_names (list): a list of record field names
+        Returns:
+            None"""
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO fields VALUES (?, ?)',
+                                  list(enumerate(field_names)))
+
+    def add_pair(self, pair: str, old_file: str, new_file: str) -> int:
+        """add pair of files
+        Args:
+            pair (string): pair name
+            old_file (string): name of old sys file
+            new_file (string): name of new sys file
+        Returns:
+            int: pair id for pair rows"""
+        with self.conn:
+            return self.conn.execute('INSERT INTO pairs (pair, old_file, new_file) '
+                                     'VALUES (?, ?, ?)', (pair, old_file, new_file)).lastrowid
+
+    def get_pair_id(self, pair: str) -> int:
+        """returns id of the last added pair with given name
+        Args:
+            pair (string): pair name
+        Returns:
+            int: pair id, None if pair is not found"""
+        return self.conn.execute('SELECT max(pair_id) FROM pairs WHERE pair = ?',
+                                 (pair, )).fetchone()[0]
+
+    def set_pair_stats(self, pair_id: int, stats: list) -> None:
+        """save pair stats
+        Args:
+            pair_id (int): pair id
+            stats (list): stats values in PAIR_STATS_COLUMNS order
+        Returns:
+            None"""
+        self.flush()
+        columns = ', '.join([f"{x} = ?" for x in PAIR_STATS_COLUMNS])
+        with self.conn:
+            self.conn.execute(f"UPDATE pairs SET {columns} WHERE pair_id = ?",
+                              list(stats) + [pair_id])
+
+    def add(self, table: str, pair_id: int, row: list) -> None:
+        """add row to table buffer
+        Args:
+            table (string): table name, one of TABLE_COLUMNS
+            pair_id (int): pair id
+            row (list): row values in TABLE_COLUMNS order
+        Returns:
+            None: performs buffered insert, flushes buffer if limit is reached"""
+        self.buffers[table].append([pair_id] + row)
+        self.buffered += 1
+        if self.buffered >= self.buffer_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """insert all buffered rows in one transaction
+        Args:
+            None
+        Returns:
+            None: performs bulk insert"""
+        if not self.buffered:
+            return
+        with self.conn:
+            for table, rows in self.buffers.items():
+                if rows:
+                    self.conn.executemany(
+                        f"INSERT INTO {table} VALUES ({', '.join(['?'] * len(rows[0]))})", rows)
+                    rows.clear()
+        self.buffered = 0
+
+    def import_db(self, f_name: str) -> None:
+        """copy pairs and rows of another results database, pair ids are renumbered
+        Args:
+            f_name (string): database filename
+        Returns:
+            None: performs rows copy"""
+        self.flush()
+        self.conn.execute('ATTACH DATABASE ? AS src', (f_name, ))
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO fields SELECT * FROM src.fields')
+            columns = ', '.join(('pair', 'old_file', 'new_file') + PAIR_STATS_COLUMNS)
+            for (pair_id, ) in self.conn.execute('SELECT pair_id FROM src.pairs').fetchall():
+                new_id = self.conn.execute(f"INSERT INTO pairs ({columns}) SELECT {columns} "
+                                           'FROM src.pairs WHERE pair_id = ?',
+                                           (pair_id, )).lastrowid
+                for table, cols in TABLE_COLUMNS.items():
+                    self.conn.execute(f"INSERT INTO {table} SELECT ?, {', '.join(cols)} "
+                                      f"FROM src.{table} WHERE pair_id = ?", (new_id, pair_id))
+        self.conn.execute('DETACH DATABASE src')
+
+    def export_pair(self, old_file: str, f_name: str) -> None:
+        """write the last pair of old sys file and its rows to another results database
+        Args:
+            old_file (string): name of old sys file of pair
+            f_name (string): database filename
+        Returns:
+            None: performs rows copy"""
+        self.flush()
+        pair_id = self.conn.execute('SELECT max(pair_id) FROM pairs WHERE old_file = ?',
+                                    (old_file, )).fetchone()[0]
+        ResultStore(f_name, self.buffer_rows).close(False)
+        self.conn.execute('ATTACH DATABASE ? AS dst', (f_name, ))
+        with self.conn:
+            self.conn.execute('INSERT INTO dst.fields SELECT * FROM fields')
+            self.conn.execute('INSERT INTO dst.pairs SELECT * FROM pairs WHERE pair_id = ?',
+                              (pair_id, ))
+            for table in TABLE_COLUMNS:
+                self.conn.execute(f"INSERT INTO dst.{table} SELECT * FROM {table} "
+                                  'WHERE pair_id = ?', (pair_id, ))
+        self.conn.execute('DETACH DATABASE dst')
+
+    def keep_pairs(self, old_files: set) -> None:
+        """delete pairs and their rows except given ones, e.g. rows of interrupted pair
+        Args:
+            old_files (set): old sys filenames of pairs to keep
+        Returns:
+            None: performs rows delete"""
+        self.flush()
+        with self.conn:
+            for (pair_id, old_file) in self.conn.execute(
+                    'SELECT pair_id, old_file FROM pairs').fetchall():
+                if old_file not in old_files:
+                    self.conn.execute('DELETE FROM pairs WHERE pair_id = ?', (pair_id, ))
+                    for table in TABLE_COLUMNS:
+                        self.conn.execute(f"DELETE FROM {table} WHERE pair_id = ?", (pair_id, ))
+
+    def close(self, indexed: bool) -> None:
+        """insert buffered rows and close database
+        Args:
+            indexed (bool): create query indexes, indexes are created once after all inserts
+        Returns:
+            None"""
+        self.flush()
+        if indexed:
+            with self.conn:
+                for i in INDEXES:
+                    self.conn.execute(i)
+        self.conn.close()
+
+
+class KeyIndex:
+    """on disk index of unmatched records of all pairs by record key, so lost and extra
+       records of the same key in different pairs are found without keeping them in memory"""
+
+    def __init__(self, f_name: str, buffer_rows: int) -> None:
+        """create index database
+        Args:
+            f_name (string): database filename, existing database is replaced
+            buffer_rows (int): rows buffer limit
+        Returns:
+            None"""
+        self.buffer_rows = buffer_rows
+        self.buffer = []
+        self.conn = sqlite3.connect(f_name)
+        with self.conn:
+            self.conn.execute('DROP TABLE IF EXISTS records')
+            self.conn.execute('CREATE TABLE records (id INTEGER PRIMARY KEY, key TEXT, '
+                              'side TEXT, pair TEXT, line TEXT)')
+
+    def add(self, key: str, side: str, pair: str, line: str) -> None:
+        """add unmatched record
+        Args:
+            key (string): record key
+            side (string): 'lost' or 'extra'
+            pair (string): pair name
+            line (string): raw record line
+        Returns:
+            None: performs buffered insert"""
+        self.buffer.append((key, side, pair, line))
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """insert buffered rows in one transaction
+        Args:
+            None
+        Returns:
+            None"""
+        with self.conn:
+            self.conn.executemany('INSERT INTO records (key, side, pair, line) '
+                                  'VALUES (?, ?, ?, ?)', self.buffer)
+        self.buffer = []
+
+    def groups(self):
+        """returns unmatched records grouped by key, records are read in key order using
+           key index
+        Args:
+            None
+        Returns:
+            generator: yields [key, records] for each key
+                records - list, [side, pair, line] of each record of key in add order"""
+        self.flush()
+        with self.conn:
+            self.conn.execute('CREATE INDEX records_key ON records (key, id)')
+        rows = self.conn.execute('SELECT key, side, pair, line FROM records ORDER BY key, id')
+        for key, group in groupby(rows, itemgetter(0)):
+            yield [key, [x[1:] for x in group]]
+
+    def close(self) -> None:
+        """close index database
+        Args:
+            None
+        Returns:
+            None"""
+        self.conn.close()
+
+
+def get_key(values: list) -> str:
+    """returns key column value
+    Args:
+        values (list): a list of diff key field values
+    Returns:
+        string: json list of key values"""
+    return json.dumps(values, ensure_ascii=False)
+
+
+def get_record(rec: list) -> str:
+    """returns record column value
+    Args:
+        rec (list): record fields list
+    Returns:
+        string: json list of record fields"""
+    return json.dumps(rec, ensure_ascii=False)
+
+
+def query(f_name: str, table: str, pair: str, field: int, key: list, limit: int) -> list:
+    """select rows of results database
+    Args:
+        f_name (string): database filename
+        table (string): 'pairs' or one of TABLE_COLUMNS
+        pair (string): pair name part, empty for all pairs
+        field (int): broken field number, None for all fields
+        key (list): a list of diff key values, empty for all keys
+        limit (int): max number of rows, 0 - no limit
+    Returns:
+        list: [columns, rows]"""
+    conditions = []
+    params = []
+    if pair:
+        conditions.append('pairs.pair LIKE ?')
+        params.append(f"%{pair}%")
+    if table == 'pairs':
+        columns = ('pair', 'old_file', 'new_file') + PAIR_STATS_COLUMNS
+        sql = f"SELECT {', '.join(columns)} FROM pairs"
+    elif table == 'broken':
+        columns = ('pair', 'key', 'field', 'field_name', 'old_value', 'new_value', 'pattern')
+        sql = ('SELECT pairs.pair, broken.key, broken.field, fields.name, broken.old_value, '
+               'broken.new_value, broken.pattern FROM broken '
+               'JOIN pairs ON pairs.pair_id = broken.pair_id '
+               'LEFT JOIN fields ON fields.field = broken.field')
+    else:
+        columns = ('pair', ) + TABLE_COLUMNS[table]
+        sql = (f"SELECT pairs.pair, {', '.join([f'{table}.{x}' for x in TABLE_COLUMNS[table]])} "
+               f"FROM {table} JOIN pairs ON pairs.pair_id = {table}.pair_id")
+    if table != 'pairs':
+        if field is not None and table == 'broken':
+            conditions.append('broken.field = ?')
+            params.append(field)
+        if key and table != 'defective':
+            conditions.append(f"{table}.key = ?")
+            params.append(get_key(key))
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    conn = sqlite3.connect(f"file:{f_name}?mode=ro", uri=True)
+    try:
+        return [columns, conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    """results query command line entry point"""
+    parser = argparse.ArgumentParser(description='compare script results query')
+    parser.add_argument('db', help='results database, diff_results.db of diff result dir')
+    parser.add_argument('table', choices=['pairs'] + list(TABLE_COLUMNS))
+    parser.add_argument('--pair', default='', help='pair name part, e.g. OldSys filename')
+    parser.add_argument('--field', type=int, help='broken field number')
+    parser.add_argument('--key', action='append', default=[],
+                        help='diff key value, repeat for each key field')
+    parser.add_argument('--limit', type=int, default=100, help='max rows, 0 - no limit')
+    args = parser.parse_args()
+
+    columns, rows = query(args.db, args.table, args.pair, args.field, args.key, args.limit)
+    print('\t'.join(columns))
+    for i in rows:
+        print('\t'.join([str(x) for x in i]))
+
+
+if __name__ == "__main__":
+    main()
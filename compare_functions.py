@@ -1,7 +1,26 @@
 """additional functions module for compare script"""
-from os import name as os_name, system as os_system
+import bz2
+import gzip
+import lzma
+from os import name as os_name, system as os_system, path as os_path
+from datetime import datetime
 from time import time as time_time, strftime as time_strftime, gmtime as time_gmtime
 from difflib import SequenceMatcher
+from functools import lru_cache
+from hashlib import sha1
+from contextlib import nullcontext
+from sys import stdout as sys_stdout
+
+LINES_COUNT_BLOCK_SIZE = 1024 * 1024
+DEEP_DIFF_CACHE_SIZE = 100000
+KEY_FIELDS_SEPARATOR = '\x1f'
+KEY_FIELDS_SEPARATOR_BYTES = KEY_FIELDS_SEPARATOR.encode()
+# compressed file openers, files are detected by extension or by magic bytes
+COMPRESSED_FILE_OPENERS = {'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+COMPRESSION_MAGIC = {b'\x1f\x8b': 'gz', b'\xfd7zXZ\x00': 'xz'}
+BZ2_MAGIC = (b'BZh', b'1AY&SY') # stream header, block size digit, first block header
+FIELD_COMPARATORS = ('exact', 'trimmed', 'nocase', 'numeric', 'timestamp')
+TIMESTAMP_FORMAT = '%Y%m%d%H%M%S' # default values format of timestamp comparator
 
 def write_to_file(f_name: str, lst1: list) -> None:
     """writes data to file
@@ -29,6 +48,27 @@ def clear_screen() -> None:
         _ = os_system('clear')
 
 
+def init_ansi_console() -> None:
+    """enable ANSI escape codes of console
+    Args:
+        None
+    Returns:
+        None: on Windows an empty command turns on escape codes processing of console"""
+    if os_name == 'nt':
+        _ = os_system('')
+
+
+def redraw_screen(text: str) -> None:
+    """redraw console in place with ANSI escape codes, no clear command is spawned
+    Args:
+        text (string): screen lines
+    Returns:
+        None: performs one console write of cursor home, lines and clear of screen rest"""
+    # each line clears its old tail, screen below the last line is cleared at the end
+    sys_stdout.write('\x1b[H' + text.replace('\n', '\x1b[K\n') + '\x1b[J')
+    sys_stdout.flush()
+
+
 def split_arg_value(arg_val: str) -> str:
     """used for kwargs split into pairs
     Args:
@@ -39,16 +79,17 @@ def split_arg_value(arg_val: str) -> str:
     return f"{res[0]}: {res[1]}"
 
 
-def progress_bar(current: int, total: int, descr: str, *kwargs) -> None:
+def progress_bar(current: int, total: int, descr: str, *kwargs, file=None) -> None:
     """Printing progress bar
     Args:
         current (int): current value
         total (int): total value
         *kwargs: additional info fields, will splitted with '│'
+        file (file object): output stream, None - sys.stdout
     Returns:
         None: performs progress bar printing"""
     bar_length = 28
-    print('\r', end='')
+    print('\r', end='', file=file)
     if total == 0:
         percents = 0
         filled = 0
@@ -57,12 +98,12 @@ def progress_bar(current: int, total: int, descr: str, *kwargs) -> None:
         filled = round((current / total * 100) * (bar_length / 100))
     unfilled = bar_length - filled
 
-    print(f"[ {'█' * round(filled)}{'░' * unfilled} ] {percents:7}%", end='')
-    print(f" │ {descr} {current} / {total}", end='')
+    print(f"[ {'█' * round(filled)}{'░' * unfilled} ] {percents:7}%", end='', file=file)
+    print(f" │ {descr} {current} / {total}", end='', file=file)
 
     if kwargs:
         for i in kwargs:
-            print(f" │ {split_arg_value(i)}", end='')
+            print(f" │ {split_arg_value(i)}", end='', file=file)
 
 
 def key_composer(rec: list, keys: list) -> str:
@@ -72,9 +113,226 @@ def key_composer(rec: list, keys: list) -> str:
         keys (list): a list of field numbers
     Returns:
         string: concatinated field values of fields listed in keys"""
-    res = ''
-    for i in keys:
-        res += rec[i]
+    # separator prevents collisions such as 'ab' + 'c' and 'a' + 'bc'
+    return KEY_FIELDS_SEPARATOR.join([rec[i] for i in keys])
+
+
+def bytes_key_composer(rec: list, keys: list) -> bytes:
+    """creates a key from key fields values of record read as bytes
+    Args:
+        rec (list): a record bytes line splitted into fields
+        keys (list): a list of field numbers
+    Returns:
+        bytes: concatinated field values of fields listed in keys"""
+    return KEY_FIELDS_SEPARATOR_BYTES.join([rec[i] for i in keys])
+
+
+def keys_from_str(keys_str: str) -> list:
+    """converts comma separated keys string to a list of field numbers
+    Args:
+        keys_str (string): keys as string, such as '0, 3'
+    Returns:
+        list: a list of field numbers"""
+    return [int(x) for x in keys_str.split(',')]
+
+
+def trimmed_equal(val1: str, val2: str) -> bool:
+    """compares values without leading and trailing spaces"""
+    return val1.strip() == val2.strip()
+
+
+def nocase_equal(val1: str, val2: str) -> bool:
+    """compares values case insensitive"""
+    return val1.casefold() == val2.casefold()
+
+
+def get_field_comparator(name: str, args: list):
+    """returns function to compare not equal values of field
+    Args:
+        name (string): comparator name, one of FIELD_COMPARATORS
+        args (list): comparator args as strings
+            numeric - tolerance, such as ['0.01']
+            timestamp - seconds and optional values format, such as ['60', '%Y%m%d%H%M%S']
+    Returns:
+        function: func(val1, val2) returns True if values are equal,
+                  None for exact comparator, values are equal if they are the same
+    Except:
+        ValueError: unknown comparator or wrong args"""
+    if name not in FIELD_COMPARATORS:
+        raise ValueError(f"unknown comparator {name}")
+    if name in ('exact', 'trimmed', 'nocase') and args:
+        raise ValueError(f"{name} comparator has no args")
+    if name == 'trimmed':
+        return trimmed_equal
+    if name == 'nocase':
+        return nocase_equal
+    if name == 'numeric':
+        if len(args) != 1:
+            raise ValueError('numeric comparator needs tolerance')
+        tolerance = float(args[0])
+
+        def numeric_equal(val1: str, val2: str) -> bool:
+            try:
+                return abs(float(val1) - float(val2)) <= tolerance
+            except ValueError:
+                return False
+        return numeric_equal
+    if name == 'timestamp':
+        if len(args) not in (1, 2):
+            raise ValueError('timestamp comparator needs seconds')
+        seconds = float(args[0])
+        fmt = args[1] if len(args) == 2 else TIMESTAMP_FORMAT
+
+        def timestamp_equal(val1: str, val2: str) -> bool:
+            try:
+                delta = datetime.strptime(val1, fmt) - datetime.strptime(val2, fmt)
+            except ValueError:
+                return False
+            return abs(delta.total_seconds()) <= seconds
+        return timestamp_equal
+    return None
+
+
+def get_fingerprint(lst1: list) -> str:
+    """returns fingerprint of a list of strings
+    Args:
+        lst1 (list): a list of strings
+    Returns:
+        string: sha1 hex digest of strings"""
+    res = sha1()
+    for i in lst1:
+        res.update(i.encode('utf-8', errors='replace'))
+        res.update(b'\n')
+    return res.hexdigest()
+
+
+def get_file_fingerprint(f_name: str) -> str:
+    """returns fingerprint of file content
+    Args:
+        f_name (string): filename
+    Returns:
+        string: sha1 hex digest of file content"""
+    res = sha1()
+    with open(f_name, 'rb') as f:
+        while True:
+            block = f.read(LINES_COUNT_BLOCK_SIZE)
+            if not block:
+                break
+            res.update(block)
+    return res.hexdigest()
+
+
+def get_file_compression(f_name: str) -> str:
+    """detects compressed file by extension, then by magic bytes of file beginning
+    Args:
+        f_name (string): filename
+    Returns:
+        string: 'gz', 'bz2', 'xz' or empty string for not compressed file"""
+    ext = os_path.splitext(f_name)[1].lower()[1:]
+    if ext in COMPRESSED_FILE_OPENERS:
+        return ext
+    with open(f_name, 'rb') as f:
+        head = f.read(10)
+    for magic, compression in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    if head.startswith(BZ2_MAGIC[0]) and head[3:4].isdigit() and head[4:] == BZ2_MAGIC[1]:
+        return 'bz2'
+    return ''
+
+
+def get_uncompressed_name(f_name: str) -> str:
+    """returns filename without compressed file extension
+    Args:
+        f_name (string): filename, such as 'old_cdr.txt.gz'
+    Returns:
+        string: filename, such as 'old_cdr.txt'"""
+    name, ext = os_path.splitext(f_name)
+    if ext.lower()[1:] in COMPRESSED_FILE_OPENERS:
+        return name
+    return f_name
+
+
+def open_file(f_name: str, mode: str, encoding: str = None):
+    """open file for read, compressed file is decompressed while it is read
+    Args:
+        f_name (string): filename
+        mode (string): 'r' - text, 'rb' - binary
+        encoding (string): file encoding for text mode
+    Returns:
+        file: opened file object"""
+    compression = get_file_compression(f_name)
+    if compression:
+        return COMPRESSED_FILE_OPENERS[compression](f_name, 'rt' if mode == 'r' else mode,
+                                                    encoding=encoding)
+    return open(f_name, mode, encoding=encoding)
+
+
+def count_file_lines(f_name: str, encoding: str) -> int:
+    """counts file lines, reading raw byte blocks for single byte and utf-8 files
+    Args:
+        f_name (string): filename
+        encoding (string): file encoding
+    Returns:
+        int: number of lines, last line without line break is counted too"""
+    res = 0
+    if encoding.startswith('utf-16'):
+        # newline byte can be a part of other chars in utf-16
+        with open_file(f_name, 'r', encoding) as f:
+            for res, _ in enumerate(f, 1):
+                pass
+        return res
+
+    last_block = b''
+    with open_file(f_name, 'rb') as f:
+        for block in iter(lambda: f.read(LINES_COUNT_BLOCK_SIZE), b''):
+            res += block.count(b'\n')
+            last_block = block
+    if last_block and not last_block.endswith(b'\n'):
+        res += 1
+    return res
+
+
+def estimate_file_lines(f_name: str, encoding: str, sample_size: int) -> int:
+    """estimates file lines using file size and bytes per line ratio of file beginning
+    Args:
+        f_name (string): filename
+        encoding (string): file encoding
+        sample_size (int): number of bytes to sample from file beginning
+    Returns:
+        int: estimated number of lines, exact number if file is smaller than sample"""
+    file_size = os_path.getsize(f_name)
+    compression = get_file_compression(f_name)
+    if file_size <= sample_size and not compression:
+        return count_file_lines(f_name, encoding)
+    with open(f_name, 'rb') as raw_f:
+        with (COMPRESSED_FILE_OPENERS[compression](raw_f, 'rb') if compression
+              else nullcontext(raw_f)) as f:
+            sample = f.read(sample_size)
+        # file bytes of sample, for compressed file it is compressed sample size
+        sample_file_size = raw_f.tell()
+    if len(sample) < sample_size:
+        return count_file_lines(f_name, encoding)
+    sample_lines = sample.decode(encoding, errors='ignore').count('\n')
+    if sample_lines == 0:
+        return 1
+    return round(file_size * sample_lines / sample_file_size)
+
+
+def get_field_slices(field_sizes: list, tail: bool) -> list:
+    """creates slices for fixed width record fields
+    Args:
+        field_sizes (list): a list of field sizes
+        tail (bool): add a slice for the rest of record after last field
+    Returns:
+        list: a list of slice objects, one for each field"""
+    res = []
+    start = 0
+    for i in field_sizes:
+        res.append(slice(start, start + i))
+        start += i
+    if tail:
+        res.append(slice(start, None))
     return res
 
 
@@ -133,3 +391,28 @@ def deep_diff(s1: str, s2: str) -> str:
         elif tag == 'insert':
             result.append('+' * len(s2[j1:j2]))
     return ''.join(result)
+
+
+def init_deep_diff_cache(size: int) -> None:
+    """creates LRU cache for diff patterns, mismatched values repeat a lot
+    Args:
+        size (int): max number of cached value pairs
+    Returns:
+        None: performs cached_deep_diff init"""
+    global cached_deep_diff
+    cached_deep_diff = lru_cache(maxsize=size)(deep_diff)
+
+
+def get_deep_diff_cache_stats() -> list:
+    """returns diff patterns cache counters
+    Args:
+        None
+    Returns:
+        list: [hits, misses, evictions]"""
+    info = cached_deep_diff.cache_info()
+    # every miss is stored unless cache is disabled, stored patterns not in cache are evicted
+    evictions = info.misses - info.currsize if info.maxsize != 0 else 0
+    return [info.hits, info.misses, evictions]
+
+
+cached_deep_diff = lru_cache(maxsize=DEEP_DIFF_CACHE_SIZE)(deep_diff)
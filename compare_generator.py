@@ -0,0 +1,169 @@
+"""synthetic CDR files generator for compare script benchmarks"""
+import argparse
+from os import path as os_path, makedirs as os_makedirs
+from random import Random
+from string import ascii_uppercase, digits
+
+VALUE_CHARS = ascii_uppercase + digits
+
+
+def get_cdr_settings(fields: int, layout: str, field_size: int) -> dict:
+    """returns compare settings for generated CDR files
+    Args:
+        fields (int): number of record fields
+        layout (string): 'char' - comma delimited, 'fixed' - fixed width fields
+        field_size (int): field width for fixed layout
+    Returns:
+        dict: cdr_options settings for settings_dict"""
+    return {
+        'number_of_fields': fields,
+        'delimiter_type': layout,
+        'delimiter': ',',
+        'record_field_names': ','.join([f"field{i}" for i in range(fields)]),
+        'record_field_sizes': ','.join([str(field_size)] * fields) if layout == 'fixed' else '',
+        'record_field_sizes_tail': False,
+        'header_records_number': 0,
+        'trailer_records_number': 0,
+        'excluded_fields': '',
+        'diff_keys': [0]
+    }
+
+
+def get_record(rnd: Random, rec_id: int, fields: int, field_size: int) -> list:
+    """returns a random record, first field is unique record id
+    Args:
+        rnd (Random): random generator
+        rec_id (int): record id
+        fields (int): number of record fields
+        field_size (int): max field value length
+    Returns:
+        list: a list of field values"""
+    rec = [str(rec_id).zfill(field_size)]
+    for _ in range(fields - 1):
+        rec.append(''.join(rnd.choices(VALUE_CHARS, k=rnd.randint(1, field_size))))
+    return rec
+
+
+def break_record(rnd: Random, rec: list) -> list:
+    """returns a copy of record with one changed char in a random non key field
+    Args:
+        rnd (Random): random generator
+        rec (list): a list of field values
+    Returns:
+        list: a list of field values"""
+    res = list(rec)
+    i = rnd.randint(1, len(res) - 1)
+    pos = rnd.randint(0, len(res[i]) - 1)
+    res[i] = res[i][:pos] + rnd.choice(VALUE_CHARS.replace(res[i][pos], '')) + res[i][pos + 1:]
+    return res
+
+
+def record_to_line(rec: list, layout: str, field_size: int) -> str:
+    """joins record fields into a line according layout
+    Args:
+        rec (list): a list of field values
+        layout (string): 'char' or 'fixed'
+        field_size (int): field width for fixed layout
+    Returns:
+        string: record line"""
+    if layout == 'fixed':
+        return ''.join([x.ljust(field_size) for x in rec]) + '\n'
+    return ','.join(rec) + '\n'
+
+
+def generate_pair(old_name: str, new_name: str, records: int, fields: int, layout: str,
+                  field_size: int, rates: dict, seed: int) -> dict:
+    """writes a pair of OldSys and NewSys CDR files, records are sorted by id
+    Args:
+        old_name (string): OldSys filename
+        new_name (string): NewSys filename
+        records (int): number of OldSys records
+        fields (int): number of record fields
+        layout (string): 'char' or 'fixed'
+        field_size (int): max field value length, field width for fixed layout
+        rates (dict): share of records, keys 'mismatch', 'lost', 'extra', 'repeat'
+        seed (int): random seed
+    Returns:
+        dict: generated records counters"""
+    rnd = Random(seed)
+    counters = {'old': 0, 'new': 0, 'mismatch': 0, 'lost': 0, 'extra': 0, 'repeat': 0}
+    with open(old_name, 'w', encoding='utf-8') as old_f, \
+         open(new_name, 'w', encoding='utf-8') as new_f:
+        for i in range(records):
+            # even ids for OldSys records, odd ids are free for extras
+            rec = get_record(rnd, i * 2, fields, field_size)
+            old_f.write(record_to_line(rec, layout, field_size))
+            counters['old'] += 1
+            if rnd.random() < rates['lost']:
+                counters['lost'] += 1
+            else:
+                if rnd.random() < rates['mismatch']:
+                    rec = break_record(rnd, rec)
+                    counters['mismatch'] += 1
+                line = record_to_line(rec, layout, field_size)
+                new_f.write(line)
+                counters['new'] += 1
+                if rnd.random() < rates['repeat']:
+                    new_f.write(line)
+                    counters['repeat'] += 1
+            if rnd.random() < rates['extra']:
+                new_f.write(record_to_line(get_record(rnd, i * 2 + 1, fields, field_size),
+                                           layout, field_size))
+                counters['new'] += 1
+                counters['extra'] += 1
+    return counters
+
+
+def generate_pairs(out_dir: str, pairs: int, records: int, fields: int, layout: str,
+                   field_size: int, rates: dict, seed: int) -> dict:
+    """writes old_/new_ CDR file pairs to out_dir/oldsys_out and out_dir/newsys_out
+    Args:
+        out_dir (string): output dir
+        pairs (int): number of file pairs
+        records (int): number of OldSys records in each file
+        fields (int): number of record fields
+        layout (string): 'char' or 'fixed'
+        field_size (int): max field value length, field width for fixed layout
+        rates (dict): share of records, keys 'mismatch', 'lost', 'extra', 'repeat'
+        seed (int): random seed
+    Returns:
+        dict: generated file pairs, key - OldSys filename, value - NewSys filename"""
+    res = {}
+    os_makedirs(os_path.join(out_dir, 'oldsys_out'), exist_ok=True)
+    os_makedirs(os_path.join(out_dir, 'newsys_out'), exist_ok=True)
+    for n in range(pairs):
+        old_name = os_path.join(out_dir, 'oldsys_out', f"old_cdr{n:03}.txt")
+        new_name = os_path.join(out_dir, 'newsys_out', f"new_cdr{n:03}.txt")
+        generate_pair(old_name, new_name, records, fields, layout, field_size, rates, seed + n)
+        res[old_name] = new_name
+    return res
+
+
+def main() -> None:
+    """generator command line entry point"""
+    parser = argparse.ArgumentParser(description='synthetic CDR pairs generator')
+    parser.add_argument('out_dir', help='output dir, oldsys_out and newsys_out are created')
+    parser.add_argument('--pairs', type=int, default=1)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--fields', type=int, default=20)
+    parser.add_argument('--layout', choices=['char', 'fixed'], default='char')
+    parser.add_argument('--field-size', type=int, default=10)
+    parser.add_argument('--mismatch-rate', type=float, default=0.05)
+    parser.add_argument('--lost-rate', type=float, default=0.01)
+    parser.add_argument('--extra-rate', type=float, default=0.01)
+    parser.add_argument('--repeat-rate', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rates = {'mismatch': args.mismatch_rate, 'lost': args.lost_rate,
+             'extra': args.extra_rate, 'repeat': args.repeat_rate}
+    generate_pairs(args.out_dir, args.pairs, args.records, args.fields, args.layout,
+                   args.field_size, rates, args.seed)
+    print('[cdr_options]')
+    for k, v in get_cdr_settings(args.fields, args.layout, args.field_size).items():
+        if k != 'diff_keys':
+            print(f"{k} = {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""background log writer module for compare script"""
+import atexit
+from os import path as os_path, remove as os_remove, replace as os_replace
+from queue import Queue, Empty
+from threading import Event, Thread
+
+RELAY_POLL_TIMEOUT = 0.1 # seconds relay thread waits for worker lines before stop check
+
+
+class LogWriter:
+    """log file writer with the file write interface, lines are put to queue and written
+       in batches by background thread, log file is rotated when size limit is reached"""
+
+    def __init__(self, f_name: str) -> None:
+        """open log file, start writing thread
+        Args:
+            f_name (string): log filename
+        Returns:
+            None"""
+        self.f_name = f_name
+        self.size_limit = 0 # bytes, 0 - no rotation
+        self.old_files_count = 0
+        self.queue = Queue()
+        self.closed = False
+        self.relay_stopped = Event()
+        self.relay_thread = None
+        self.f = open(f_name, 'a+', encoding='utf-8')
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+        # queued lines are written on script exit, e.g. after sys.exit on settings error
+        atexit.register(self.close)
+
+    def set_rotation(self, size_limit: int, old_files_count: int) -> None:
+        """set log file rotation limits
+        Args:
+            size_limit (int): log file size limit, bytes, 0 - no rotation
+            old_files_count (int): number of rotated log files to keep, f_name.1 is the newest
+        Returns:
+            None"""
+        self.size_limit = size_limit
+        self.old_files_count = old_files_count
+
+    def get_file_names(self) -> list:
+        """returns log filename and names of existing rotated log files
+        Args:
+            None
+        Returns:
+            list: a list of log filenames"""
+        return [self.f_name] + [f"{self.f_name}.{i}" for i in range(1, self.old_files_count + 1)
+                                if os_path.exists(f"{self.f_name}.{i}")]
+
+    def start_relay(self, queue) -> None:
+        """start thread which writes lines of pool workers to log, so log file is opened
+           and rotated by one process only
+        Args:
+            queue (multiprocessing.Queue): queue of worker lines, see QueueLogWriter
+        Returns:
+            None"""
+        self.relay_stopped.clear()
+        self.relay_thread = Thread(target=self._relay, args=(queue, ), daemon=True)
+        self.relay_thread.start()
+
+    def stop_relay(self) -> None:
+        """write worker lines which are already queued, stop relay thread
+        Args:
+            None
+        Returns:
+            None"""
+        if self.relay_thread is not None:
+            self.relay_stopped.set()
+            self.relay_thread.join()
+            self.relay_thread = None
+
+    def write(self, line: str) -> None:
+        """put line to write queue
+        Args:
+            line (string): log line
+        Returns:
+            None: line is written by writing thread"""
+        if not self.closed:
+            self.queue.put(line)
+
+    def flush(self) -> None:
+        """wait until all queued lines are written to log file
+        Args:
+            None
+        Returns:
+            None"""
+        if not self.closed:
+            done = Event()
+            self.queue.put(done)
+            while not done.wait(RELAY_POLL_TIMEOUT):
+                if not self.thread.is_alive():
+                    return
+
+    def close(self) -> None:
+        """write queued lines, stop writing thread and close log file
+        Args:
+            None
+        Returns:
+            None: next writes are ignored"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self) -> None:
+        """write queued lines in batches, None in queue stops writing"""
+        while True:
+            items = [self.queue.get()]
+            # take all lines queued while previous batch was written
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            lines = []
+            for i in items:
+                if isinstance(i, str):
+                    lines.append(i)
+                    continue
+                self._write(lines)
+                lines = []
+                if i is None:
+                    self.f.close()
+                    return
+                i.set() # flush marker
+            self._write(lines)
+
+    def _relay(self, queue) -> None:
+        """put lines of worker queue to write queue until relay is stopped"""
+        while True:
+            try:
+                self.write(queue.get(timeout=RELAY_POLL_TIMEOUT))
+            except Empty:
+                if self.relay_stopped.is_set():
+                    return
+
+    def _write(self, lines: list) -> None:
+        """write batch of lines, rotate log file if its size is over limit"""
+        try:
+            if lines:
+                self.f.write(''.join(lines))
+            self.f.flush()
+            if self.size_limit and self.f.tell() >= self.size_limit:
+                self._rotate()
+        except (OSError, ValueError):
+            # log write error must not stop writing thread, lines of batch are lost
+            pass
+
+    def _rotate(self) -> None:
+        """shift rotated log files, current log file becomes f_name.1"""
+        self.f.close()
+        try:
+            if self.old_files_count:
+                for i in range(self.old_files_count - 1, 0, -1):
+                    if os_path.exists(f"{self.f_name}.{i}"):
+                        os_replace(f"{self.f_name}.{i}", f"{self.f_name}.{i + 1}")
+                os_replace(self.f_name, f"{self.f_name}.1")
+            else:
+                os_remove(self.f_name)
+        finally:
+            # log is written to the same file if rotation failed
+            self.f = open(self.f_name, 'a+', encoding='utf-8')
+
+
+class QueueLogWriter:
+    """log writer of pool worker, lines are put to multiprocessing queue and written by
+       relay thread of main process LogWriter"""
+
+    def __init__(self, queue) -> None:
+        """init worker log writer
+        Args:
+            queue (multiprocessing.Queue): queue of worker lines, see LogWriter.start_relay
+        Returns:
+            None"""
+        self.queue = queue
+
+    def write(self, line: str) -> None:
+        """put line to main process
+        Args:
+            line (string): log line
+        Returns:
+            None: line is written by main process"""
+        self.queue.put(line)
+
+    def flush(self) -> None:
+        """lines are written by main process, nothing to flush
+        Args:
+            None
+        Returns:
+            None"""
+
+    def close(self) -> None:
+        """lines are written by main process, nothing to close
+        Args:
+            None
+        Returns:
+            None"""
@@ -0,0 +1,158 @@
+"""background and memory mapped file readers module for compare script"""
+from array import array
+from itertools import accumulate, islice
+from mmap import mmap, ACCESS_READ
+from os import fstat as os_fstat
+from queue import Queue, Empty
+from threading import Thread
+from time import perf_counter
+import compare_functions as cf
+
+
+class LinesReader:
+    """reads file lines in background thread into bounded queue of line blocks, so file
+       is read ahead while lines which are already read are parsed and compared,
+       compressed file is decompressed in reading thread too"""
+
+    BLOCK_SIZE = 1024 * 1024 # chars or bytes in one block of lines
+
+    def __init__(self, f_name: str, encoding: str, buffer_size: int) -> None:
+        """init reader, start reading thread
+        Args:
+            f_name (string): filename
+            encoding (string): file encoding, None - lines are read as bytes
+            buffer_size (int): read ahead limit, chars
+        Returns:
+            None"""
+        self.f_name = f_name
+        self.encoding = encoding
+        self.queue = Queue(max(buffer_size // self.BLOCK_SIZE, 1))
+        self.stopped = False
+        self.wait_time = 0.0 # seconds lines consumer waited for file reads
+        self.thread = Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def __iter__(self):
+        """yields file lines one by one
+        Except:
+            OSError, ValueError: file read or decode error of reading thread"""
+        while True:
+            start = perf_counter()
+            block = self.queue.get()
+            self.wait_time += perf_counter() - start
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                return
+            yield from block
+
+    def close(self) -> None:
+        """stop reading thread, next lines are not read
+        Args:
+            None
+        Returns:
+            None: performs reading thread stop"""
+        self.stopped = True
+        while self.thread.is_alive():
+            # free queue place, so reading thread is not blocked
+            try:
+                self.queue.get(timeout=0.1)
+            except Empty:
+                pass
+
+    def _read(self) -> None:
+        """read blocks of lines to queue, empty block is put at the end of file"""
+        try:
+            with cf.open_file(self.f_name, 'r' if self.encoding else 'rb',
+                              self.encoding) as f:
+                while not self.stopped:
+                    block = f.readlines(self.BLOCK_SIZE)
+                    self.queue.put(block)
+                    if not block:
+                        break
+        except (OSError, ValueError) as err:
+            # file or decode error is raised to lines consumer
+            self.queue.put(err)
+
+
+class MappedLines:
+    """memory mapped file lines, start offsets of lines are indexed in one pass over file
+       bytes, lines are sliced from mapping by line number without file iteration"""
+
+    INDEX_BLOCK_SIZE = 16 * 1024 * 1024 # bytes indexed at once
+
+    def __init__(self, f_name: str, encoding: str) -> None:
+        """map file, build line offsets index
+        Args:
+            f_name (string): filename, not compressed file
+            encoding (string): file encoding with single byte line break, None - lines are
+                               returned as bytes
+        Returns:
+            None"""
+        self.encoding = encoding
+        self.f = open(f_name, 'rb')
+        size = os_fstat(self.f.fileno()).st_size
+        # empty file can not be mapped
+        self.mm = mmap(self.f.fileno(), 0, access=ACCESS_READ) if size else b''
+        self.offsets = array('Q', [0]) # line start offsets, the last one is file size
+        self._index(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def line(self, n: int):
+        """returns file line by line number
+        Args:
+            n (int): line number
+        Returns:
+            string or bytes: file line"""
+        res = self.mm[self.offsets[n]:self.offsets[n + 1]]
+        return self._decode(res) if self.encoding else res
+
+    def lines(self, start: int, stop: int):
+        """returns file lines of line numbers range
+        Args:
+            start (int): first line number
+            stop (int): line number after the last one
+        Returns:
+            iterator: file lines"""
+        res = map(self.mm.__getitem__, map(slice, islice(self.offsets, start, stop),
+                                           islice(self.offsets, start + 1, stop + 1)))
+        return map(self._decode, res) if self.encoding else res
+
+    def close(self) -> None:
+        """unmap and close file
+        Args:
+            None
+        Returns:
+            None"""
+        if isinstance(self.mm, mmap):
+            self.mm.close()
+        self.f.close()
+
+    def _decode(self, line: bytes) -> str:
+        """decode line as text mode file gives it"""
+        return line.decode(self.encoding).replace('\r\n', '\n')
+
+    def _index(self, size: int) -> None:
+        """add start offsets of lines to index, block by block"""
+        pos = 0
+        while pos < size:
+            end = self.mm.rfind(b'\n', pos, pos + self.INDEX_BLOCK_SIZE) + 1
+            if end <= pos:
+                # line is longer than block
+                end = self.mm.find(b'\n', pos + self.INDEX_BLOCK_SIZE) + 1 or size
+            lines = self.mm[pos:end].split(b'\n')
+            lines.pop() # empty part after the last line break or the last line without it
+            # next line starts after line and its line break
+            self.offsets.extend(islice(accumulate(map((1).__add__, map(len, lines)),
+                                                  initial=pos), 1, None))
+            pos = end
+        if self.offsets[-1] != size:
+            self.offsets.append(size)
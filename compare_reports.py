@@ -0,0 +1,79 @@
+"""report files writer module for compare script"""
+from threading import Lock
+
+
+class ReportWriter:
+    """keeps one opened handle for each report file, collects reports in memory
+       buffer and writes them in bulk when buffer size limit is reached"""
+
+    def __init__(self, buffer_size: int) -> None:
+        """init report writer
+        Args:
+            buffer_size (int): memory buffer limit, chars
+        Returns:
+            None"""
+        self.buffer_size = buffer_size
+        self.buffered = 0
+        self.buffers = {}
+        self.handles = {}
+        self.closed = False
+        self.lock = Lock()
+
+    def write(self, f_name: str, rep_str: str) -> None:
+        """add report string to report file buffer
+        Args:
+            f_name (string): report filename
+            rep_str (string): report string
+        Returns:
+            None: performs buffered write, flushes buffer if limit is reached"""
+        # writer is closed by stat thread on interrupt while diff thread writes
+        with self.lock:
+            if self.closed:
+                return
+            if f_name not in self.buffers:
+                self.buffers[f_name] = [rep_str]
+            else:
+                self.buffers[f_name].append(rep_str)
+            self.buffered += len(rep_str)
+            if self.buffered > self.buffer_size:
+                self._flush()
+
+    def flush(self) -> None:
+        """write all buffered reports to report files
+        Args:
+            None
+        Returns:
+            None: performs bulk write of buffered data, report files are flushed to disk"""
+        with self.lock:
+            if not self.closed:
+                self._flush()
+
+    def close(self) -> None:
+        """flush buffered reports and close all report files
+        Args:
+            None
+        Returns:
+            None: performs report files close, next writes are ignored"""
+        with self.lock:
+            if self.closed:
+                return
+            self._write_buffers()
+            self.closed = True
+            for f in self.handles.values():
+                f.close()
+            self.handles.clear()
+
+    def _flush(self) -> None:
+        """write buffers and flush report files, lock is taken by caller"""
+        self._write_buffers()
+        for f in self.handles.values():
+            f.flush()
+
+    def _write_buffers(self) -> None:
+        """write buffers to report files, opens report file on first write"""
+        for f_name, lst in self.buffers.items():
+            if f_name not in self.handles:
+                self.handles[f_name] = open(f_name, 'a', encoding='utf-8')
+            self.handles[f_name].write(''.join(lst))
+        self.buffers.clear()
+        self.buffered = 0
@@ -0,0 +1,139 @@
+"""compact records storage module for compare script"""
+import pickle
+from array import array
+
+
+class RecordStore:
+    """compact storage of file records. Raw record lines are packed into shared text
+       blocks, a record is a pair of offsets in block, dict keeps record number for
+       each key. Record line is sliced out only when it is needed"""
+    __slots__ = ('index', 'blocks', 'offsets', 'pending', 'pending_offsets', 'empty')
+
+    BLOCK_SIZE = 4096 # records in one text block
+
+    def __init__(self, empty='') -> None:
+        """init empty store
+        Args:
+            empty (string or bytes): empty line, b'' - store keeps bytes lines
+        Returns:
+            None"""
+        self.empty = empty
+        self.index = {}
+        self.blocks = []
+        self.offsets = []
+        self.pending = []
+        self.pending_offsets = array('I', [0])
+
+    def add(self, key: str, line) -> bool:
+        """add record line to store
+        Args:
+            key (string or bytes): record key
+            line (string or bytes): raw record line
+        Returns:
+            bool: True - record is added, False - key is already in store (repeat)"""
+        if key in self.index:
+            return False
+        self.index[key] = len(self.index)
+        self.pending.append(line)
+        self.pending_offsets.append(self.pending_offsets[-1] + len(line))
+        if len(self.pending) == self.BLOCK_SIZE:
+            self.blocks.append(self.empty.join(self.pending))
+            self.offsets.append(self.pending_offsets)
+            self.pending = []
+            self.pending_offsets = array('I', [0])
+        return True
+
+    def line(self, n: int):
+        """returns raw line of record by record number
+        Args:
+            n (int): record number
+        Returns:
+            string or bytes: raw record line"""
+        block, i = divmod(n, self.BLOCK_SIZE)
+        if block == len(self.blocks):
+            return self.pending[i]
+        offsets = self.offsets[block]
+        return self.blocks[block][offsets[i]:offsets[i + 1]]
+
+    def keys(self):
+        """returns keys view of store records"""
+        return self.index.keys()
+
+    def items(self):
+        """returns (key, record number) view of store records"""
+        return self.index.items()
+
+    def __getitem__(self, key):
+        return self.line(self.index[key])
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+class SpilledRecords:
+    """records spilled to bucket files on disk by hash of record key, records of the same
+       key are always in the same bucket, so buckets are diffed one by one"""
+
+    def __init__(self, f_name: str, buckets: int, buffer_size: int) -> None:
+        """create bucket files
+        Args:
+            f_name (string): bucket files name prefix, bucket number is added to it
+            buckets (int): number of buckets
+            buffer_size (int): memory buffer limit for all buckets, chars or bytes of lines
+        Returns:
+            None"""
+        self.names = [f"{f_name}.{i}" for i in range(buckets)]
+        self.buffer_size = buffer_size
+        self.buffered = 0
+        self.pending = [[] for _ in range(buckets)]
+        self.handles = [open(x, 'wb') for x in self.names]
+
+    def add(self, key, line) -> None:
+        """add record to its bucket buffer
+        Args:
+            key (string or bytes): record key
+            line (string or bytes): raw record line
+        Returns:
+            None: performs buffered write, flushes buffers if limit is reached"""
+        self.pending[hash(key) % len(self.pending)].append((key, line))
+        self.buffered += len(line)
+        if self.buffered > self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """write buffered records of each bucket as one pickled chunk
+        Args:
+            None
+        Returns:
+            None: performs bulk write of buffered records"""
+        for f, lst in zip(self.handles, self.pending):
+            if lst:
+                pickle.dump(lst, f, pickle.HIGHEST_PROTOCOL)
+                lst.clear()
+        self.buffered = 0
+
+    def close(self) -> None:
+        """write buffered records and close bucket files, buckets can be read then
+        Args:
+            None
+        Returns:
+            None"""
+        self.flush()
+        for f in self.handles:
+            f.close()
+
+    def bucket(self, n: int):
+        """returns records of bucket in write order
+        Args:
+            n (int): bucket number
+        Returns:
+            generator: yields (key, line) for each record of bucket"""
+        with open(self.names[n], 'rb') as f:
+            while True:
+                try:
+                    yield from pickle.load(f)
+                except EOFError:
+                    return
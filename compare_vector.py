@@ -0,0 +1,42 @@
+"""numpy column-wise records comparison module for compare script"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def is_available() -> bool:
+    """check if numpy engine can be used
+    Args:
+        None
+    Returns:
+        bool: True - numpy is installed"""
+    return np is not None
+
+
+def get_column_array(recs: list):
+    """load records into 2D array, each column keeps values of one field
+    Args:
+        recs (list): a list of records with the same number of fields
+    Returns:
+        ndarray: object array of field values, strings are not copied"""
+    res = np.empty((len(recs), len(recs[0])), dtype=object)
+    res[:] = recs
+    return res
+
+
+def get_mismatches(etl_recs: list, src_recs: list, fields: list) -> list:
+    """compare batch of records column-wise, all records must have the same number of fields
+    Args:
+        etl_recs (list): a list of old sys records
+        src_recs (list): a list of new sys records, same order as etl_recs
+        fields (list): a list of field numbers to compare
+    Returns:
+        list: [counts, cells]
+            counts - list, number of mismatched values for each field of fields
+            cells - list, [record number, field number] of each mismatched value,
+                    ordered by record number, then by field number"""
+    mask = get_column_array(etl_recs)[:, fields] != get_column_array(src_recs)[:, fields]
+    rows, cols = np.nonzero(mask)
+    field_numbers = np.array(fields, dtype=int)[cols]
+    return [mask.sum(axis=0).tolist(), list(zip(rows.tolist(), field_numbers.tolist()))]